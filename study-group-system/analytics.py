@@ -0,0 +1,232 @@
+"""
+Rollups for /admin/analytics: per-subject totals and per-day, per-subject
+activity counters, kept current by triggers in the same transaction as
+every group and membership write, so the endpoint never scans history.
+
+Rebuild them from the base tables (e.g. after restoring a backup) with:
+
+    python analytics.py rebuild
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+from database import ConnectionPool
+
+# subject_stats holds the current state of each subject's groups;
+# subject_daily_stats counts what happened each (UTC) day. Leaves include
+# members removed along with a deleted group or user
+ROLLUP_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS subject_stats (
+        subject TEXT PRIMARY KEY,
+        groups INTEGER NOT NULL DEFAULT 0,
+        full_groups INTEGER NOT NULL DEFAULT 0,
+        members INTEGER NOT NULL DEFAULT 0,
+        capacity INTEGER NOT NULL DEFAULT 0  -- Sum of max_members
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS subject_daily_stats (
+        day TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        groups_created INTEGER NOT NULL DEFAULT 0,
+        joins INTEGER NOT NULL DEFAULT 0,
+        leaves INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, subject)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_group_added
+    AFTER INSERT ON study_groups
+    BEGIN
+        INSERT INTO subject_stats (subject, groups, full_groups, members, capacity)
+        VALUES (NEW.subject, 1, COALESCE(NEW.current_members, 0) >= NEW.max_members,
+                COALESCE(NEW.current_members, 0), COALESCE(NEW.max_members, 0))
+        ON CONFLICT (subject) DO UPDATE SET
+            groups = groups + excluded.groups,
+            full_groups = full_groups + excluded.full_groups,
+            members = members + excluded.members,
+            capacity = capacity + excluded.capacity;
+        INSERT INTO subject_daily_stats (day, subject, groups_created)
+        VALUES (COALESCE(date(NEW.created_at), date('now')), NEW.subject, 1)
+        ON CONFLICT (day, subject) DO UPDATE SET groups_created = groups_created + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_group_removed
+    AFTER DELETE ON study_groups
+    BEGIN
+        UPDATE subject_stats SET
+            groups = groups - 1,
+            full_groups = full_groups - (COALESCE(OLD.current_members, 0) >= OLD.max_members),
+            members = members - COALESCE(OLD.current_members, 0),
+            capacity = capacity - COALESCE(OLD.max_members, 0)
+        WHERE subject = OLD.subject;
+    END;
+
+    -- Fires on every join and leave (current_members changes), so it only
+    -- touches the one subject row
+    CREATE TRIGGER IF NOT EXISTS rollup_group_updated
+    AFTER UPDATE OF subject, current_members, max_members ON study_groups
+    BEGIN
+        UPDATE subject_stats SET
+            groups = groups - 1,
+            full_groups = full_groups - (COALESCE(OLD.current_members, 0) >= OLD.max_members),
+            members = members - COALESCE(OLD.current_members, 0),
+            capacity = capacity - COALESCE(OLD.max_members, 0)
+        WHERE subject = OLD.subject;
+        INSERT INTO subject_stats (subject, groups, full_groups, members, capacity)
+        VALUES (NEW.subject, 1, COALESCE(NEW.current_members, 0) >= NEW.max_members,
+                COALESCE(NEW.current_members, 0), COALESCE(NEW.max_members, 0))
+        ON CONFLICT (subject) DO UPDATE SET
+            groups = groups + excluded.groups,
+            full_groups = full_groups + excluded.full_groups,
+            members = members + excluded.members,
+            capacity = capacity + excluded.capacity;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_member_added
+    AFTER INSERT ON group_members
+    BEGIN
+        INSERT INTO subject_daily_stats (day, subject, joins)
+        SELECT COALESCE(date(NEW.joined_at), date('now')), subject, 1
+        FROM study_groups WHERE id = NEW.group_id
+        ON CONFLICT (day, subject) DO UPDATE SET joins = joins + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS rollup_member_removed
+    AFTER DELETE ON group_members
+    BEGIN
+        INSERT INTO subject_daily_stats (day, subject, leaves)
+        SELECT date('now'), subject, 1
+        FROM study_groups WHERE id = OLD.group_id
+        ON CONFLICT (day, subject) DO UPDATE SET leaves = leaves + 1;
+    END;
+'''
+
+# Longest window /admin/analytics reports day by day
+MAX_ANALYTICS_DAYS = 366
+
+DAILY_STATS_QUERY = 'SELECT * FROM subject_daily_stats WHERE day >= ? ORDER BY day'
+
+
+def init_rollup_tables(conn):
+    """
+    Create the rollup tables and their triggers, filling them from the
+    existing groups and memberships the first time
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'subject_stats'").fetchone()
+    conn.executescript(ROLLUP_SCHEMA)
+    if not exists:
+        rebuild_rollups(conn, commit=False)
+
+
+def rebuild_rollups(conn, commit=True):
+    """
+    Recompute the rollups from study_groups and group_members. Past leaves
+    can't be recovered, so daily joins count only the memberships that
+    still exist
+    """
+    conn.execute('DELETE FROM subject_stats')
+    conn.execute('DELETE FROM subject_daily_stats')
+    conn.execute('''
+        INSERT INTO subject_stats (subject, groups, full_groups, members, capacity)
+        SELECT subject, COUNT(*), SUM(COALESCE(current_members, 0) >= max_members),
+               SUM(COALESCE(current_members, 0)), SUM(COALESCE(max_members, 0))
+        FROM study_groups
+        GROUP BY subject
+    ''')
+    conn.execute('''
+        INSERT INTO subject_daily_stats (day, subject, groups_created)
+        SELECT COALESCE(date(created_at), date('now')), subject, COUNT(*)
+        FROM study_groups
+        GROUP BY 1, 2
+    ''')
+    conn.execute('''
+        INSERT INTO subject_daily_stats (day, subject, joins)
+        SELECT COALESCE(date(gm.joined_at), date('now')), g.subject, COUNT(*)
+        FROM group_members gm
+        JOIN study_groups g ON g.id = gm.group_id
+        GROUP BY 1, 2
+        ON CONFLICT (day, subject) DO UPDATE SET joins = excluded.joins
+    ''')
+    if commit:
+        conn.commit()
+
+
+def fill_rate(members, capacity):
+    return round(members / capacity, 4) if capacity else None
+
+
+def get_analytics(conn, days=30, top=10):
+    """
+    Fill rates, joins per day and per subject and the most popular subjects
+    over the last `days` days, read from the rollups only: the cost depends
+    on the number of subjects and days, not on the number of groups or
+    memberships
+    """
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    subjects = {
+        row['subject']: {
+            'subject': row['subject'],
+            'groups': row['groups'],
+            'full_groups': row['full_groups'],
+            'members': row['members'],
+            'capacity': row['capacity'],
+            'fill_rate': fill_rate(row['members'], row['capacity']),
+            'joins': 0,
+            'leaves': 0,
+            'groups_created': 0
+        }
+        for row in conn.execute('SELECT * FROM subject_stats WHERE groups > 0')
+    }
+
+    per_day = {}
+    for row in conn.execute(DAILY_STATS_QUERY, (since,)):
+        day = per_day.setdefault(row['day'], {'day': row['day'], 'joins': 0, 'leaves': 0, 'groups_created': 0})
+        for counter in ('joins', 'leaves', 'groups_created'):
+            day[counter] += row[counter]
+            if row['subject'] in subjects:
+                subjects[row['subject']][counter] += row[counter]
+
+    members = sum(subject['members'] for subject in subjects.values())
+    capacity = sum(subject['capacity'] for subject in subjects.values())
+    by_subject = sorted(subjects.values(), key=lambda subject: subject['subject'])
+    return {
+        'days': days,
+        'since': since,
+        'totals': {
+            'groups': sum(subject['groups'] for subject in by_subject),
+            'full_groups': sum(subject['full_groups'] for subject in by_subject),
+            'members': members,
+            'capacity': capacity,
+            'fill_rate': fill_rate(members, capacity)
+        },
+        'joins_per_day': list(per_day.values()),
+        'subjects': by_subject,
+        'popular_subjects': [
+            subject['subject'] for subject in
+            sorted(by_subject, key=lambda subject: (-subject['joins'], -subject['members']))[:top]
+        ]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Admin analytics rollups')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_parser = subparsers.add_parser('rebuild', help='Recompute the rollups from the base tables')
+    rebuild_parser.add_argument('--db', default='study_groups.db', help='Path to the SQLite database')
+
+    args = parser.parse_args()
+
+    if args.command == 'rebuild':
+        pool = ConnectionPool(args.db, max_idle=1)
+        conn = pool.connect()
+        started = time.monotonic()
+        try:
+            conn.executescript(ROLLUP_SCHEMA)
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_rollups(conn)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+        print(f'Rebuilt rollups in {time.monotonic() - started:.2f}s')
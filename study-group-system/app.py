@@ -1,12 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Flask, Response, render_template, request, redirect, url_for, session, jsonify, stream_with_context
 import sqlite3
 import os
+import base64
+import json
+import re
+import heapq
+import zlib
 from datetime import datetime, timedelta
 from matching_engine import MatchingEngine  # Import the matching engine
-
-def check_password(hashed_password, password):
-    from werkzeug.security import check_password_hash
-    return check_password_hash(hashed_password, password)
+from database import ConnectionPool, WriteBatcher
+from facets import FacetCache
+from response_cache import ResponseCache
+from analytics import MAX_ANALYTICS_DAYS, get_analytics, init_rollup_tables
+from passwords import HasherBusy, PasswordHasher
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.secret_key = 'your_secret_key_here'  # Change this to a random secret key
@@ -14,11 +20,249 @@ app.secret_key = 'your_secret_key_here'  # Change this to a random secret key
 # Database setup
 DATABASE = 'study_groups.db'
 
+# Write-ahead logging lets readers carry on while a writer commits. The
+# journal mode is stored in the database file, so init_db sets it once; the
+# per-connection pragmas live in database.DEFAULT_PRAGMAS
+SQLITE_WAL = True
+
+# Secondary indexes managed by init_db (name -> definition). Indexes named
+# idx_* that are no longer listed here are dropped. Hot query plans are
+# checked by `python benchmarks.py query-plans`
+INDEXES = {
+    # /find-group filters; created_at is included for the paginated, newest-first order
+    'idx_study_groups_subject_created_at': 'study_groups (subject, created_at)',
+    'idx_study_groups_goal_created_at': 'study_groups (goal, created_at)',
+    'idx_study_groups_date_iso': 'study_groups (date_iso)',
+    # /my-groups created groups, admin lists
+    'idx_study_groups_created_by': 'study_groups (created_by, created_at)',
+    'idx_study_groups_created_at': 'study_groups (created_at)',
+    'idx_users_created_at': 'users (created_at)',
+    # Members of a group (group_members lookups by user_id use the UNIQUE(user_id, group_id) index)
+    'idx_group_members_group': 'group_members (group_id, user_id)',
+    # Open groups scanned by MatchingEngine.get_recommendations
+    'idx_study_groups_open': 'study_groups (id) WHERE current_members < max_members',
+    # Latest finished refresh, read on every /auto-match
+    'idx_recommendation_runs_finished': 'recommendation_runs (generation) WHERE finished_at IS NOT NULL',
+}
+
+# Full-text index over the searchable study_groups columns, used by the
+# /find-group q= search. It is an external-content table (the text is read
+# from study_groups) kept in sync by these triggers
+GROUP_SEARCH_SCHEMA = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS study_groups_fts USING fts5(
+        name, subject, description, goal, location,
+        content='study_groups', content_rowid='id'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS study_groups_fts_insert
+    AFTER INSERT ON study_groups
+    BEGIN
+        INSERT INTO study_groups_fts (rowid, name, subject, description, goal, location)
+        VALUES (new.id, new.name, new.subject, new.description, new.goal, new.location);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS study_groups_fts_delete
+    AFTER DELETE ON study_groups
+    BEGIN
+        INSERT INTO study_groups_fts (study_groups_fts, rowid, name, subject, description, goal, location)
+        VALUES ('delete', old.id, old.name, old.subject, old.description, old.goal, old.location);
+    END;
+
+    -- Only the indexed columns, so member count updates don't touch the index
+    CREATE TRIGGER IF NOT EXISTS study_groups_fts_update
+    AFTER UPDATE OF name, subject, description, goal, location ON study_groups
+    BEGIN
+        INSERT INTO study_groups_fts (study_groups_fts, rowid, name, subject, description, goal, location)
+        VALUES ('delete', old.id, old.name, old.subject, old.description, old.goal, old.location);
+        INSERT INTO study_groups_fts (rowid, name, subject, description, goal, location)
+        VALUES (new.id, new.name, new.subject, new.description, new.goal, new.location);
+    END;
+'''
+
+# Connections are pooled and shared with the matching engine; close() hands
+# a connection back to the pool
+db_pool = ConnectionPool(DATABASE)
+
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_pool.connect()
+
+# Opt-in group commit: joins, leaves and group creation from concurrent
+# requests are queued and committed together every few milliseconds
+# (database.WriteBatcher). Each request still returns only after its write
+# has committed
+WRITE_BATCHING = False
+write_batcher = WriteBatcher(db_pool, interval=0.002) if WRITE_BATCHING else None
+
+# Shared matching engine. Its membership index is loaded once and then kept
+# current by the routes below after each committed membership change
+matching_engine = MatchingEngine(DATABASE, pool=db_pool)
+
+# Subject and goal facets for /api/facets, /api/subjects and /api/goals,
+# kept current by the routes below like the matching engine's index
+facet_cache = FacetCache(ttl=300)
+
+# /my-groups and /group/<id> page data, invalidated by bumping the version of
+# each user and group the routes below change
+response_cache = ResponseCache(maxsize=4096, ttl=60)
+
+# Password hashing for register/login runs in a pool of worker processes
+# (passwords.PasswordHasher), at most PASSWORD_HASH_MAX_PENDING calls queued
+# or running at once. PASSWORD_HASH_METHOD is Werkzeug's default, which
+# existing hashes were made with. To move to new parameters, change it and
+# set PASSWORD_REHASH_ON_LOGIN, which upgrades each user's stored hash at
+# their next login
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:600000'
+PASSWORD_REHASH_ON_LOGIN = False
+PASSWORD_HASH_WORKERS = os.cpu_count()
+PASSWORD_HASH_MAX_PENDING = 64
+password_hasher = PasswordHasher(
+    PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING, queue_timeout=5,
+    rehash=PASSWORD_REHASH_ON_LOGIN
+)
+
+# How long browsers and proxies may reuse /api/facets without revalidating
+FACETS_MAX_AGE = 60
+
+# Upper bound on the number of groups scored by one /api/compatibility call
+MAX_COMPATIBILITY_GROUPS = 200
+
+# Fields that /find-group JSON can return (name -> SQL expression), and the
+# ones returned when no fields= projection is given
+FIND_GROUP_FIELDS = {
+    'id': 'g.id',
+    'name': 'g.name',
+    'subject': 'g.subject',
+    'description': 'g.description',
+    'goal': 'g.goal',
+    'date': 'g.date',
+    'time': "COALESCE(g.time, '')",  # time might not exist in schema
+    'location': "COALESCE(g.location, '')",  # location might not exist in schema
+    'current_members': 'g.current_members',
+    'max_members': 'g.max_members',
+    'creator': 'u.student_id',
+    'created_at': 'g.created_at',
+}
+DEFAULT_FIND_GROUP_FIELDS = ['id', 'name', 'subject', 'goal', 'date', 'time', 'location', 'current_members', 'max_members', 'creator']
+
+# /find-group JSON page sizes
+FIND_GROUP_PAGE_SIZE = 50
+MAX_FIND_GROUP_PAGE_SIZE = 200
+
+def encode_cursor(sort_key, group_id):
+    """
+    Opaque pagination cursor: the created_at and id of the last group of a
+    page, or for searches the offset of the next page and the highest group
+    id when the search started
+    """
+    return base64.urlsafe_b64encode(json.dumps([sort_key, group_id]).encode()).decode()
+
+def decode_cursor(cursor, key_type=str):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    try:
+        sort_key, group_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(sort_key, key_type) or isinstance(sort_key, bool) or not isinstance(group_id, int):
+        raise ValueError('Invalid cursor')
+    return sort_key, group_id
+
+def find_group_columns(fields):
+    """SQL select list for /find-group JSON fields (keys of FIND_GROUP_FIELDS)"""
+    return ', '.join(f'{FIND_GROUP_FIELDS[field]} AS {field}' for field in fields)
 
+def date_filter_range(date_filter, today):
+    """
+    (first, last) ISO day of a /find-group date filter (today, thisWeek or
+    nextWeek), or None for any other value
+    """
+    if date_filter == 'today':
+        return today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+    if date_filter == 'thisWeek':
+        # Calculate start of week (Monday) and end of week (Sunday)
+        start_of_week = today - timedelta(days=today.weekday())
+    elif date_filter == 'nextWeek':
+        # Calculate start of next week and end of next week
+        start_of_week = today - timedelta(days=today.weekday()) + timedelta(weeks=1)
+    else:
+        return None
+    end_of_week = start_of_week + timedelta(days=6)
+    return start_of_week.strftime('%Y-%m-%d'), end_of_week.strftime('%Y-%m-%d')
+
+def find_group_query(columns, search_match=None, subject=None, goal=None, date_range=None,
+                     limit=None, cursor=None, snapshot_id=None, offset=0):
+    """
+    (sql, params) for /find-group. A search is ranked by bm25, anything else
+    is newest first. With a limit, one page: for a search the `limit` groups
+    from `offset` among those with id <= snapshot_id, otherwise the `limit`
+    groups after the (created_at, id) cursor
+    """
+    if search_match:
+        # bm25 is lower for better matches; name and subject hits weigh the most
+        query = f'''
+            SELECT {columns}, bm25(study_groups_fts, 10.0, 5.0, 1.0, 5.0, 2.0) AS cursor_key, g.id AS cursor_id
+            FROM study_groups_fts
+            JOIN study_groups g ON g.id = study_groups_fts.rowid
+            JOIN users u ON g.created_by = u.id 
+            WHERE study_groups_fts MATCH ?
+        '''
+        params = [search_match]
+    else:
+        query = f'''
+            SELECT {columns}, g.created_at AS cursor_key, g.id AS cursor_id
+            FROM study_groups g 
+            JOIN users u ON g.created_by = u.id 
+            WHERE 1=1
+        '''
+        params = []
+        
+    if subject:
+        query += ' AND g.subject = ?'
+        params.append(subject)
+        
+    if goal:
+        query += ' AND g.goal = ?'
+        params.append(goal)
+        
+    # date_iso holds date(g.date), so these are index range scans
+    if date_range:
+        if date_range[0] == date_range[1]:
+            query += ' AND g.date_iso = ?'
+            params.append(date_range[0])
+        else:
+            query += ' AND g.date_iso BETWEEN ? AND ?'
+            params.extend(date_range)
+        
+    if search_match:
+        # Best match first, ties by id
+        if limit is not None:
+            query += ' AND g.id <= ?'
+            params.append(snapshot_id)
+        query += ' ORDER BY cursor_key, g.id'
+    else:
+        # Newest first; the cursor is the (created_at, id) of the last row sent
+        if cursor:
+            query += ' AND (g.created_at, g.id) < (?, ?)'
+            params.extend(cursor)
+        query += ' ORDER BY g.created_at DESC, g.id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+        if search_match:
+            query += ' OFFSET ?'
+            params.append(offset)
+    return query, params
+
+def search_match_query(text):
+    """
+    FTS5 MATCH expression for free text typed by a user: every word must
+    match, the last one as a prefix. Returns None if there are no words
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
 
 def ensure_db_exists():
     """Ensure the database file and tables exist"""
@@ -28,10 +272,14 @@ def ensure_db_exists():
         print(f"Error initializing database: {e}")
         raise
 
-def init_db():
+def init_db(db=None, wal=SQLITE_WAL):
     """Initialize the database with required tables"""
     with app.app_context():
-        db = get_db_connection()
+        if db is None:
+            db = get_db_connection()
+        
+        # Enable (or go back from) write-ahead logging
+        db.execute(f"PRAGMA journal_mode = {'WAL' if wal else 'DELETE'}")
         
         # Create users table
         db.execute('''
@@ -55,6 +303,7 @@ def init_db():
                 description TEXT,
                 goal TEXT,
                 date TEXT,
+                date_iso TEXT,  -- date normalized with date(), for indexed date filters
                 time TEXT,
                 location TEXT,
                 max_members INTEGER DEFAULT 4,
@@ -81,6 +330,21 @@ def init_db():
             except sqlite3.OperationalError:
                 pass  # Column already exists
         
+        # Add the normalized date column if it doesn't exist, and backfill it
+        try:
+            db.execute('SELECT date_iso FROM study_groups LIMIT 1')
+        except sqlite3.OperationalError:
+            db.execute('ALTER TABLE study_groups ADD COLUMN date_iso TEXT')
+        db.execute('UPDATE study_groups SET date_iso = date(date) WHERE date_iso IS NULL AND date(date) IS NOT NULL')
+        
+        # Create the full-text search index, filling it from existing groups the first time
+        search_index_exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'study_groups_fts'"
+        ).fetchone()
+        db.executescript(GROUP_SEARCH_SCHEMA)
+        if not search_index_exists:
+            db.execute("INSERT INTO study_groups_fts (study_groups_fts) VALUES ('rebuild')")
+        
         # Create group_members table
         db.execute('''
             CREATE TABLE IF NOT EXISTS group_members (
@@ -110,13 +374,70 @@ def init_db():
             )
         ''')
         
+        # Create the change log that keeps every process's membership index current
+        matching_engine.init_membership_changes(db)
+        
+        # Create precomputed recommendation tables (filled by `python matching_engine.py refresh`)
+        matching_engine.init_recommendation_tables(db)
+        
+        # Create the /admin/analytics rollups, filling them from existing data the first time
+        init_rollup_tables(db)
+        
+        # Create managed indexes and drop the ones no longer managed
+        existing_indexes = db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx\\_%' ESCAPE '\\'"
+        ).fetchall()
+        for index in existing_indexes:
+            if index['name'] not in INDEXES:
+                db.execute(f"DROP INDEX {index['name']}")
+        for name, definition in INDEXES.items():
+            db.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+        
         db.commit()
+        db.execute('PRAGMA optimize')
         db.close()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+BUSY_MESSAGE = 'The server is busy, please try again in a moment'
+
+def busy_response():
+    """JSON 503 for a register/login turned away by a full hashing queue"""
+    response = jsonify({'success': False, 'message': BUSY_MESSAGE})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+USER_BY_STUDENT_ID_QUERY = 'SELECT * FROM users WHERE student_id = ?'
+
+def authenticate(student_id, password):
+    """
+    The user row if the password matches, else None. With
+    PASSWORD_REHASH_ON_LOGIN, a hash made with other parameters than
+    PASSWORD_HASH_METHOD is replaced with a current one. Raises HasherBusy
+    when the hashing queue is full
+    """
+    conn = get_db_connection()
+    user = conn.execute(USER_BY_STUDENT_ID_QUERY, (student_id,)).fetchone()
+    conn.close()
+    if user is None:
+        return None
+    
+    matches, new_hash = password_hasher.verify(user['password_hash'], password)
+    if not matches:
+        return None
+    if new_hash is not None:
+        # Only if unchanged since it was read, so a concurrent password change wins
+        conn = get_db_connection()
+        conn.execute(
+            'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+            (new_hash, user['id'], user['password_hash'])
+        )
+        conn.commit()
+        conn.close()
+    return user
+
 @app.route('/register', methods=['GET', 'POST'])
 @app.route('/auth/register', methods=['POST'])
 def register():
@@ -133,8 +454,10 @@ def register():
             return jsonify({'success': False, 'message': 'Name, Student ID, and Password are required'}), 400
         
         # Hash the password before storing
-        from werkzeug.security import generate_password_hash
-        hashed_password = generate_password_hash(password)
+        try:
+            hashed_password = password_hasher.hash(password)
+        except HasherBusy:
+            return busy_response()
         
         try:
             conn = get_db_connection()
@@ -171,8 +494,10 @@ def register():
             password = request.form['password']
                     
             # Hash the password before storing
-            from werkzeug.security import generate_password_hash
-            hashed_password = generate_password_hash(password)
+            try:
+                hashed_password = password_hasher.hash(password)
+            except HasherBusy:
+                return render_template('register.html', error=BUSY_MESSAGE)
                     
             try:
                 conn = get_db_connection()
@@ -216,13 +541,12 @@ def login():
         if not student_id or not password:
             return jsonify({'success': False, 'message': 'Student ID and Password are required'}), 400
         
-        conn = get_db_connection()
-        user = conn.execute(
-            'SELECT * FROM users WHERE student_id = ?', (student_id,)
-        ).fetchone()
-        conn.close()
+        try:
+            user = authenticate(student_id, password)
+        except HasherBusy:
+            return busy_response()
         
-        if user and check_password(user['password_hash'], password):
+        if user:
             session['user_id'] = user['id']
             session['username'] = user['student_id']
             session['role'] = 'admin' if user['is_admin'] else 'student'
@@ -237,13 +561,12 @@ def login():
             username = request.form['student_id']
             password = request.form['password']
             
-            conn = get_db_connection()
-            user = conn.execute(
-                'SELECT * FROM users WHERE student_id = ?', (username,)
-            ).fetchone()
-            conn.close()
+            try:
+                user = authenticate(username, password)
+            except HasherBusy:
+                return render_template('login.html', error=BUSY_MESSAGE)
             
-            if user and check_password(user['password_hash'], password):
+            if user:
                 session['user_id'] = user['id']
                 session['username'] = user['student_id']
                 session['role'] = 'admin' if user['is_admin'] else 'student'
@@ -279,6 +602,36 @@ def admin_logout():
     
     return redirect(url_for('index'))
 
+def insert_study_group(conn, name, subject, description, goal, date, time, location, max_members, created_by):
+    """
+    Insert a study group with its creator as the first member, within the
+    caller's transaction. Returns the new group id
+    """
+    group_id = conn.execute(
+        'INSERT INTO study_groups (name, subject, description, goal, date, date_iso, time, location, max_members, current_members, created_by) VALUES (?, ?, ?, ?, ?, date(?), ?, ?, ?, 1, ?)',
+        (name, subject, description, goal, date, date, time, location, max_members, created_by)
+    ).lastrowid
+    conn.execute(
+        'INSERT INTO group_members (user_id, group_id) VALUES (?, ?)',
+        (created_by, group_id)
+    )
+    return group_id
+
+def create_study_group(name, subject, description, goal, date, time, location, max_members, created_by):
+    """Create a study group (see insert_study_group) in one commit, batched if enabled"""
+    args = (name, subject, description, goal, date, time, location, max_members, created_by)
+    if write_batcher is not None:
+        return write_batcher.submit(lambda conn: insert_study_group(conn, *args))
+    
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        group_id = insert_study_group(conn, *args)
+        conn.commit()
+    finally:
+        conn.close()
+    return group_id
+
 @app.route('/create-group', methods=['GET', 'POST'])
 def create_group():
     if 'user_id' not in session:
@@ -302,28 +655,14 @@ def create_group():
             name = f"{subject} Study Group"
             description = f"Study session for {subject} on {date} at {time} located at {location}. Goal: {goal}"
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO study_groups (name, subject, description, goal, date, time, location, max_members, created_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                (name, subject, description, goal, date, time, location, max_members, session['user_id'])
+            group_id = create_study_group(
+                name, subject, description, goal, date, time, location, max_members, session['user_id']
             )
-            group_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
             
-            # Add the creator as a member of their own group
-            conn = get_db_connection()
-            conn.execute(
-                'INSERT OR IGNORE INTO group_members (user_id, group_id) VALUES (?, ?)',
-                (session['user_id'], group_id)
-            )
-            conn.execute(
-                'UPDATE study_groups SET current_members = current_members + 1 WHERE id = ?',
-                (group_id,)
-            )
-            conn.commit()
-            conn.close()
+            matching_engine.group_added(group_id, subject, max_members)
+            matching_engine.member_added(session['user_id'], group_id)
+            facet_cache.group_added(group_id, subject, goal, 1, max_members)
+            response_cache.bump(('group', group_id), ('user', session['user_id']))
             
             return jsonify({'message': 'Group created successfully', 'group_id': group_id})
         else:
@@ -337,28 +676,14 @@ def create_group():
             location = request.form.get('location', '')  # Get location from form if available
             max_members = int(request.form['max_members'])
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                'INSERT INTO study_groups (name, subject, description, goal, date, time, location, max_members, created_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                (name, subject, description, goal, date, time, location, max_members, session['user_id'])
+            group_id = create_study_group(
+                name, subject, description, goal, date, time, location, max_members, session['user_id']
             )
-            group_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
             
-            # Add the creator as a member of their own group
-            conn = get_db_connection()
-            conn.execute(
-                'INSERT OR IGNORE INTO group_members (user_id, group_id) VALUES (?, ?)',
-                (session['user_id'], group_id)
-            )
-            conn.execute(
-                'UPDATE study_groups SET current_members = current_members + 1 WHERE id = ?',
-                (group_id,)
-            )
-            conn.commit()
-            conn.close()
+            matching_engine.group_added(group_id, subject, max_members)
+            matching_engine.member_added(session['user_id'], group_id)
+            facet_cache.group_added(group_id, subject, goal, 1, max_members)
+            response_cache.bump(('group', group_id), ('user', session['user_id']))
             
             return redirect(url_for('my_groups'))
     
@@ -366,84 +691,156 @@ def create_group():
 
 @app.route('/find-group')
 def find_group():
+    wants_json = (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
+       request.args.get('format') == 'json' or \
+       (request.path.startswith('/find-group') and request.is_json)
+
     if 'user_id' not in session:
-        if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
-           request.args.get('format') == 'json' or \
-           (request.path.startswith('/find-group') and request.is_json):
+        if wants_json:
             return jsonify({'error': 'Not logged in'}), 401
         return redirect(url_for('login'))
     
+    # The HTML page is a shell; find.js fetches its groups a page at a time
+    if not wants_json:
+        return render_template('find-group.html')
+    
     # Get filter parameters
     subject_filter = request.args.get('subject')
     goal_filter = request.args.get('goal')
     date_filter = request.args.get('date')
     
+    # Full-text search; results are ranked by bm25 instead of newest first
+    search_match = search_match_query(request.args.get('q', ''))
+    
+    # Optional projection, e.g. fields=id,subject,date. The id is always returned
+    fields = DEFAULT_FIND_GROUP_FIELDS
+    if request.args.get('fields'):
+        fields = ['id'] + [field for field in request.args['fields'].split(',') if field and field != 'id']
+        unknown = [field for field in fields if field not in FIND_GROUP_FIELDS]
+        if unknown:
+            return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    columns = find_group_columns(fields)
+
+    # Pagination is used when page_size or cursor is given, and always for searches
+    paginate = 'page_size' in request.args or 'cursor' in request.args or search_match is not None
+    try:
+        page_size = int(request.args.get('page_size', FIND_GROUP_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page_size must be an integer'}), 400
+    if not 1 <= page_size <= MAX_FIND_GROUP_PAGE_SIZE:
+        return jsonify({'error': f'page_size must be between 1 and {MAX_FIND_GROUP_PAGE_SIZE}'}), 400
+    cursor = None
+    if request.args.get('cursor'):
+        try:
+            cursor = decode_cursor(request.args['cursor'], int if search_match else str)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        if search_match and cursor[0] < 0:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
     conn = get_db_connection()
     
-    # Build the query with optional filters
-    query = '''
-        SELECT g.id, g.name, g.subject, g.description, g.goal, g.date, g.time, g.location, g.max_members, g.current_members, g.created_by, g.created_at, u.student_id as creator 
-        FROM study_groups g 
-        JOIN users u ON g.created_by = u.id 
-        WHERE 1=1
-    '''
-    params = []
-        
-    if subject_filter and subject_filter != 'all':
-        query += ' AND g.subject = ?'
-        params.append(subject_filter)
-        
-    if goal_filter and goal_filter != 'all':
-        query += ' AND g.goal = ?'
-        params.append(goal_filter)
-        
-    # Add date filtering logic
-    if date_filter and date_filter != 'all':
-        # datetime and timedelta are already imported at the top of the file
-        today = datetime.now().date()
-            
-        if date_filter == 'today':
-            query += ' AND date(g.date) = date(?)'
-            params.append(today.strftime('%Y-%m-%d'))
-        elif date_filter == 'thisWeek':
-            # Calculate start of week (Monday) and end of week (Sunday)
-            start_of_week = today - timedelta(days=today.weekday())
-            end_of_week = start_of_week + timedelta(days=6)
-            query += ' AND date(g.date) BETWEEN date(?) AND date(?)'
-            params.append(start_of_week.strftime('%Y-%m-%d'))
-            params.append(end_of_week.strftime('%Y-%m-%d'))
-        elif date_filter == 'nextWeek':
-            # Calculate start of next week and end of next week
-            start_of_next_week = today - timedelta(days=today.weekday()) + timedelta(weeks=1)
-            end_of_next_week = start_of_next_week + timedelta(days=6)
-            query += ' AND date(g.date) BETWEEN date(?) AND date(?)'
-            params.append(start_of_next_week.strftime('%Y-%m-%d'))
-            params.append(end_of_next_week.strftime('%Y-%m-%d'))
-        
+    # bm25 scores shift whenever the indexed text changes, so they can't be
+    # a stable keyset cursor. Search pages are offsets into the ranking of
+    # the groups that existed at the first page (id <= snapshot_id)
+    offset, snapshot_id = 0, None
+    if search_match and paginate:
+        if cursor:
+            offset, snapshot_id = cursor
+        else:
+            snapshot_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM study_groups').fetchone()[0]
+    
+    query, params = find_group_query(
+        columns,
+        search_match=search_match,
+        subject=subject_filter if subject_filter != 'all' else None,
+        goal=goal_filter if goal_filter != 'all' else None,
+        date_range=date_filter_range(date_filter, datetime.now().date()),
+        limit=page_size + 1 if paginate else None,
+        cursor=cursor if not search_match else None,
+        snapshot_id=snapshot_id,
+        offset=offset
+    )
     groups = conn.execute(query, params).fetchall()
     conn.close()
     
-    # Return JSON if requested by JavaScript
-    if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
-       request.args.get('format') == 'json' or \
-       (request.path.startswith('/find-group') and request.is_json):
-        groups_list = []
-        for group in groups:
-            groups_list.append({
-                'id': group['id'],
-                'name': group['name'],
-                'subject': group['subject'],
-                'goal': group['goal'],
-                'date': group['date'],
-                'time': group['time'] if group['time'] else '',  # time might not exist in schema
-                'location': group['location'] if group['location'] else '',  # location might not exist in schema
-                'current_members': group['current_members'],
-                'max_members': group['max_members'],
-                'creator': group['creator']
-            })
+    groups_list = [{field: group[field] for field in fields} for group in groups]
+    if not paginate:
         return jsonify(groups_list)
+
+    next_cursor = None
+    if len(groups) > page_size:
+        if search_match:
+            next_cursor = encode_cursor(offset + page_size, snapshot_id)
+        else:
+            last = groups[page_size - 1]
+            next_cursor = encode_cursor(last['cursor_key'], last['cursor_id'])
+    return jsonify({'groups': groups_list[:page_size], 'next_cursor': next_cursor})
+
+def group_summary(group, group_type):
+    """/my-groups JSON entry for a study group row"""
+    return {
+        'id': group['id'],
+        'name': group['name'],
+        'subject': group['subject'],
+        'goal': group['goal'],
+        'date': group['date'],
+        'time': group['time'] if group['time'] else '',  # time might not exist in schema
+        'location': group['location'] if group['location'] else '',  # location might not exist in schema
+        'current_members': group['current_members'],
+        'max_members': group['max_members'],
+        'creator': group['creator'],
+        'created_at': group['created_at'],
+        'type': group_type
+    }
+
+# /my-groups: the groups a user has joined and the ones they created, newest first
+MY_JOINED_GROUPS_QUERY = '''
+    SELECT sg.id, sg.name, sg.subject, sg.description, sg.goal, sg.date, sg.time, sg.location, sg.max_members, sg.current_members, sg.created_by, sg.created_at, u.student_id as creator 
+    FROM study_groups sg
+    JOIN group_members gm ON sg.id = gm.group_id
+    JOIN users u ON sg.created_by = u.id
+    WHERE gm.user_id = ?
+    ORDER BY sg.created_at DESC
+'''
+MY_CREATED_GROUPS_QUERY = 'SELECT id, name, subject, description, goal, date, time, location, max_members, current_members, created_by, created_at, (SELECT student_id FROM users WHERE id = created_by) as creator FROM study_groups WHERE created_by = ? ORDER BY created_at DESC'
+
+def load_my_groups(user_id):
+    """
+    Groups a user has joined and created, plus both merged into the /my-groups
+    JSON list, from the response cache or else the database
+    """
+    cached = response_cache.get(('my_groups', user_id))
+    if cached is not None:
+        return cached
+    
+    loaded_at_version = response_cache.current_version()
+    conn = get_db_connection()
+    
+    # Get groups the user has joined
+    my_groups = conn.execute(MY_JOINED_GROUPS_QUERY, (user_id,)).fetchall()
+    
+    # Get groups the user has created
+    created_groups = conn.execute(MY_CREATED_GROUPS_QUERY, (user_id,)).fetchall()
+    
+    conn.close()
     
-    return render_template('find-group.html', groups=groups)
+    # Both lists are already newest first, so one merge pass keeps that order.
+    # Joined groups the user also created are typed 'created', and created
+    # groups they are not a member of (edge case) are added once
+    created_group_ids = {group['id'] for group in created_groups}
+    joined_group_ids = {group['id'] for group in my_groups}
+    all_groups = list(heapq.merge(
+        [group_summary(group, 'created' if group['id'] in created_group_ids else 'joined') for group in my_groups],
+        [group_summary(group, 'created') for group in created_groups if group['id'] not in joined_group_ids],
+        key=lambda group: group['created_at'],
+        reverse=True
+    ))
+    
+    result = (my_groups, created_groups, all_groups)
+    dependencies = [('user', user_id)] + [('group', group_id) for group_id in joined_group_ids | created_group_ids]
+    response_cache.put(('my_groups', user_id), result, dependencies, loaded_at_version)
+    return result
 
 @app.route('/my-groups')
 def my_groups():
@@ -454,80 +851,93 @@ def my_groups():
             return jsonify({'error': 'Not logged in'}), 401
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    
-    # Get groups the user has joined
-    my_groups = conn.execute('''
-        SELECT sg.id, sg.name, sg.subject, sg.description, sg.goal, sg.date, sg.time, sg.location, sg.max_members, sg.current_members, sg.created_by, sg.created_at, u.student_id as creator 
-        FROM study_groups sg
-        JOIN group_members gm ON sg.id = gm.group_id
-        JOIN users u ON sg.created_by = u.id
-        WHERE gm.user_id = ?
-        ORDER BY sg.created_at DESC
-    ''', (session['user_id'],)).fetchall()
-    
-    # Get groups the user has created
-    created_groups = conn.execute(
-        'SELECT id, name, subject, description, goal, date, time, location, max_members, current_members, created_by, created_at, (SELECT student_id FROM users WHERE id = created_by) as creator FROM study_groups WHERE created_by = ? ORDER BY created_at DESC',
-        (session['user_id'],)
-    ).fetchall()
-    
-    conn.close()
+    my_groups, created_groups, all_groups = load_my_groups(session['user_id'])
     
     # Return JSON if requested by JavaScript
     if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
        request.args.get('format') == 'json' or \
        (request.path.startswith('/my-groups') and request.is_json):
-        groups_list = []
+        return jsonify(all_groups)
+    
+    return render_template('my-groups.html', my_groups=my_groups, created_groups=created_groups)
+
+# Membership writes of add_member and remove_member. A join only inserts
+# while the group has room; JOIN_STATUS_QUERY tells why it didn't
+JOIN_GROUP_QUERY = '''
+    INSERT OR IGNORE INTO group_members (user_id, group_id)
+    SELECT ?, id FROM study_groups WHERE id = ? AND current_members < max_members
+'''
+JOIN_STATUS_QUERY = 'SELECT EXISTS (SELECT 1 FROM group_members WHERE user_id = ? AND group_id = ?) AS is_member FROM study_groups WHERE id = ?'
+LEAVE_GROUP_QUERY = 'DELETE FROM group_members WHERE user_id = ? AND group_id = ?'
+DELETE_GROUP_MEMBERS_QUERY = 'DELETE FROM group_members WHERE group_id = ?'
+DELETE_USER_MEMBERSHIPS_QUERY = 'DELETE FROM group_members WHERE user_id = ?'
+
+def add_member(conn, user_id, group_id, commit=True):
+    """
+    Add a user to a group in a single write transaction that only inserts
+    while the group has room, so concurrent joins can never overfill it.
+    Returns (status, group): status is 'joined', 'already_member', 'full' or
+    'not_found', and group has the current_members and max_members the join
+    left behind (None unless joined). With commit=False it runs inside the
+    caller's transaction instead, as for the WriteBatcher
+    """
+    if commit:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        joined = conn.execute(JOIN_GROUP_QUERY, (user_id, group_id)).rowcount
         
-        # Combine and sort all groups by creation date in descending order
-        all_groups = []
+        if joined:
+            group = conn.execute(
+                'UPDATE study_groups SET current_members = current_members + 1 WHERE id = ? RETURNING current_members, max_members',
+                (group_id,)
+            ).fetchone()
+            if commit:
+                conn.commit()
+            return 'joined', group
         
-        # Create a set of created group IDs to identify them properly
-        created_group_ids = set(group['id'] for group in created_groups)
+        # Nothing inserted: find out why
+        group = conn.execute(JOIN_STATUS_QUERY, (user_id, group_id, group_id)).fetchone()
+    finally:
+        if commit and conn.in_transaction:
+            conn.rollback()
+    
+    if group is None:
+        return 'not_found', None
+    return ('already_member' if group['is_member'] else 'full'), None
+
+def remove_member(conn, user_id, group_id, commit=True):
+    """
+    Remove a user from a group, decrementing the member count only if a
+    membership was actually deleted. Returns (status, group) like
+    add_member, with status 'left', 'not_member' or 'not_found'
+    """
+    if commit:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        left = conn.execute(LEAVE_GROUP_QUERY, (user_id, group_id)).rowcount
         
-        # Add joined groups and determine type
-        for group in my_groups:
-            group_type = 'created' if group['id'] in created_group_ids else 'joined'
-            all_groups.append({
-                'id': group['id'],
-                'name': group['name'],
-                'subject': group['subject'],
-                'goal': group['goal'],
-                'date': group['date'],
-                'time': group['time'] if group['time'] else '',  # time might not exist in schema
-                'location': group['location'] if group['location'] else '',  # location might not exist in schema
-                'current_members': group['current_members'],
-                'max_members': group['max_members'],
-                'creator': group['creator'],
-                'created_at': group['created_at'],
-                'type': group_type
-            })
-        
-        # Add groups that user created but is not a member of (edge case)
-        for group in created_groups:
-            if not any(g['id'] == group['id'] for g in all_groups):
-                all_groups.append({
-                    'id': group['id'],
-                    'name': group['name'],
-                    'subject': group['subject'],
-                    'goal': group['goal'],
-                    'date': group['date'],
-                    'time': group['time'] if group['time'] else '',  # time might not exist in schema
-                    'location': group['location'] if group['location'] else '',  # location might not exist in schema
-                    'current_members': group['current_members'],
-                    'max_members': group['max_members'],
-                    'creator': group['creator'],
-                    'created_at': group['created_at'],
-                    'type': 'created'  # indicate this is a created group
-                })
-        
-        # Sort all groups by creation date in descending order
-        all_groups.sort(key=lambda x: x['created_at'], reverse=True)
+        if left:
+            group = conn.execute(
+                'UPDATE study_groups SET current_members = MAX(current_members - 1, 0) WHERE id = ? RETURNING current_members, max_members',
+                (group_id,)
+            ).fetchone()
+            if commit:
+                conn.commit()
+            return 'left', group
         
-        return jsonify(all_groups)
+        group = conn.execute('SELECT 1 FROM study_groups WHERE id = ?', (group_id,)).fetchone()
+    finally:
+        if commit and conn.in_transaction:
+            conn.rollback()
     
-    return render_template('my-groups.html', my_groups=my_groups, created_groups=created_groups)
+    return ('not_member' if group else 'not_found'), None
+
+# Error messages and HTTP status for each add_member outcome other than 'joined'
+JOIN_ERRORS = {
+    'already_member': ('Already joined this group', 200),
+    'full': ('This group is full', 200),
+    'not_found': ('Group not found', 404),
+}
 
 @app.route('/join-group/<int:group_id>', methods=['GET', 'POST'])
 def join_group(group_id):
@@ -536,42 +946,80 @@ def join_group(group_id):
             return jsonify({'error': 'Not logged in'}), 401
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    
-    # Check if user is already in the group
-    existing_member = conn.execute(
-        'SELECT * FROM group_members WHERE user_id = ? AND group_id = ?',
-        (session['user_id'], group_id)
-    ).fetchone()
-    
-    if existing_member:
-        conn.close()
-        if request.method == 'POST':
-            return jsonify({'error': 'Already joined this group'})
-        return redirect(url_for('find_group'))
+    # Join only if not already a member and the group has room, atomically
+    user_id = session['user_id']
+    if write_batcher is not None:
+        status, group = write_batcher.submit(lambda conn: add_member(conn, user_id, group_id, commit=False))
+    else:
+        conn = get_db_connection()
+        try:
+            status, group = add_member(conn, user_id, group_id)
+        finally:
+            conn.close()
     
-    # Add user to the group
-    try:
-        conn.execute(
-            'INSERT INTO group_members (user_id, group_id) VALUES (?, ?)',
-            (session['user_id'], group_id)
-        )
-        # Update current members count
-        conn.execute(
-            'UPDATE study_groups SET current_members = current_members + 1 WHERE id = ?',
-            (group_id,)
-        )
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass  # User already joined
-    finally:
-        conn.close()
+    if status == 'joined':
+        matching_engine.member_added(session['user_id'], group_id)
+        facet_cache.group_updated(group_id, group['current_members'], group['max_members'])
+        response_cache.bump(('group', group_id), ('user', session['user_id']))
     
     if request.method == 'POST':
-        return jsonify({'message': 'Successfully joined group', 'group_id': group_id})
+        if status == 'joined':
+            return jsonify({'message': 'Successfully joined group', 'group_id': group_id, 'status': status})
+        message, http_status = JOIN_ERRORS[status]
+        return jsonify({'error': message, 'status': status}), http_status
     
+    if status != 'joined':
+        return redirect(url_for('find_group'))
     return redirect(url_for('my_groups'))
 
+# Everything /group/<id> shows in one round trip: the group, its creator
+# and the first `limit` members by name (LIMIT -1 for all of them). Only
+# those members are aggregated, however large the group
+VIEW_GROUP_QUERY = '''
+    SELECT sg.*, u.student_id as creator,
+        (SELECT json_group_array(json_object('student_id', student_id, 'name', name)) FROM (
+            SELECT mu.student_id, mu.name FROM group_members gm JOIN users mu ON mu.id = gm.user_id
+            WHERE gm.group_id = sg.id ORDER BY mu.name LIMIT ?
+        )) AS members
+    FROM study_groups sg JOIN users u ON sg.created_by = u.id
+    WHERE sg.id = ?
+'''
+
+# Who may see /group/<id>: read from the database on every request, since
+# the cached page may miss memberships changed by other processes
+GROUP_ACCESS_QUERY = '''
+    SELECT created_by,
+        EXISTS (SELECT 1 FROM group_members WHERE user_id = ? AND group_id = sg.id) AS is_member
+    FROM study_groups sg
+    WHERE sg.id = ?
+'''
+
+def load_group_page(group_id, member_limit=None):
+    """
+    (group, members) for /group/<id>, from the response cache or else the
+    database. group is None if the group doesn't exist; members holds at
+    most member_limit members
+    """
+    cached = response_cache.get(('group_page', group_id, member_limit))
+    if cached is not None:
+        return cached
+    
+    loaded_at_version = response_cache.current_version()
+    conn = get_db_connection()
+    group = conn.execute(
+        VIEW_GROUP_QUERY, (-1 if member_limit is None else member_limit, group_id)
+    ).fetchone()
+    conn.close()
+    
+    if group is None:
+        result = (None, [])
+    else:
+        # json_group_array doesn't promise to keep the subquery's order
+        members = sorted(json.loads(group['members']), key=lambda member: member['name'])
+        result = (group, members)
+    response_cache.put(('group_page', group_id, member_limit), result, [('group', group_id)], loaded_at_version)
+    return result
+
 @app.route('/group/<int:group_id>')
 def view_group(group_id):
     if 'user_id' not in session:
@@ -581,50 +1029,31 @@ def view_group(group_id):
             return jsonify({'error': 'Not logged in'}), 401
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    
-    # Check if user is a member of the group
-    user_is_member = conn.execute(
-        'SELECT 1 FROM group_members WHERE user_id = ? AND group_id = ?',
-        (session['user_id'], group_id)
-    ).fetchone()
+    # Optional cap on the member list for very large groups
+    try:
+        member_limit = int(request.args['member_limit']) if request.args.get('member_limit') else None
+    except ValueError:
+        member_limit = None
+    if member_limit is not None and member_limit < 0:
+        member_limit = None
     
-    # Also check if user is the creator of the group
-    user_is_creator = conn.execute(
-        'SELECT 1 FROM study_groups WHERE id = ? AND created_by = ?',
-        (group_id, session['user_id'])
-    ).fetchone()
+    # Only members and the creator of the group may see it (a group that
+    # doesn't exist has neither)
+    conn = get_db_connection()
+    access = conn.execute(GROUP_ACCESS_QUERY, (session['user_id'], group_id)).fetchone()
+    conn.close()
+    allowed = access is not None and (access['is_member'] or access['created_by'] == session['user_id'])
+    if allowed:
+        group, members = load_group_page(group_id, member_limit)
+        allowed = group is not None  # Unless deleted since the check
     
-    if not user_is_member and not user_is_creator:
-        conn.close()
+    if not allowed:
         if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
            request.args.get('format') == 'json' or \
            (request.path.startswith('/group/') and request.is_json):
             return jsonify({'error': 'Access denied - not a member of this group'}), 403
         return render_template('find-group.html', groups=[], error='You are not a member of this group')
     
-    # Get group details
-    group = conn.execute(
-        'SELECT sg.*, u.student_id as creator FROM study_groups sg JOIN users u ON sg.created_by = u.id WHERE sg.id = ?',
-        (group_id,)
-    ).fetchone()
-    
-    if not group:
-        conn.close()
-        if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
-           request.args.get('format') == 'json' or \
-           (request.path.startswith('/group/') and request.is_json):
-            return jsonify({'error': 'Group not found'}), 404
-        return render_template('find-group.html', groups=[], error='Group not found')
-    
-    # Get group members
-    members = conn.execute(
-        'SELECT u.student_id, u.name FROM users u JOIN group_members gm ON u.id = gm.user_id WHERE gm.group_id = ? ORDER BY u.name',
-        (group_id,)
-    ).fetchall()
-    
-    conn.close()
-    
     # Return JSON if requested by JavaScript
     if (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type')) or \
        request.args.get('format') == 'json' or \
@@ -646,7 +1075,8 @@ def view_group(group_id):
             'members': [{
                 'student_id': member['student_id'],
                 'name': member['name']
-            } for member in members]
+            } for member in members],
+            'member_count': group['current_members']
         })
     
     return render_template('view-group.html', group=group, members=members)
@@ -657,20 +1087,21 @@ def leave_group(group_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
+    # Remove user from the group; the count only changes if they were a member
+    user_id = session['user_id']
+    if write_batcher is not None:
+        status, group = write_batcher.submit(lambda conn: remove_member(conn, user_id, group_id, commit=False))
+    else:
+        conn = get_db_connection()
+        try:
+            status, group = remove_member(conn, user_id, group_id)
+        finally:
+            conn.close()
     
-    # Remove user from the group
-    conn.execute(
-        'DELETE FROM group_members WHERE user_id = ? AND group_id = ?',
-        (session['user_id'], group_id)
-    )
-    # Update current members count
-    conn.execute(
-        'UPDATE study_groups SET current_members = current_members - 1 WHERE id = ?',
-        (group_id,)
-    )
-    conn.commit()
-    conn.close()
+    if status == 'left':
+        matching_engine.member_removed(session['user_id'], group_id)
+        facet_cache.group_updated(group_id, group['current_members'], group['max_members'])
+        response_cache.bump(('group', group_id), ('user', session['user_id']))
     
     return redirect(url_for('my_groups'))
 
@@ -699,7 +1130,7 @@ def user_delete_group(group_id):
         conn.execute('BEGIN IMMEDIATE')
         
         # Delete group members
-        conn.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
+        conn.execute(DELETE_GROUP_MEMBERS_QUERY, (group_id,))
         
         # Delete the study group
         conn.execute('DELETE FROM study_groups WHERE id = ?', (group_id,))
@@ -707,6 +1138,10 @@ def user_delete_group(group_id):
         conn.commit()
         conn.close()
         
+        matching_engine.group_removed(group_id)
+        facet_cache.group_removed(group_id)
+        response_cache.bump(('group', group_id))
+        
         return jsonify({'success': True, 'message': 'Group deleted successfully'})
     
     except Exception as e:
@@ -734,25 +1169,62 @@ def api_user():
     else:
         return jsonify({'error': 'User not found'}), 404
 
+def get_facet_cache():
+    """The facet cache, (re)loaded first if it is empty or past its TTL"""
+    if not facet_cache.is_fresh():
+        conn = get_db_connection()
+        facet_cache.load(conn)
+        conn.close()
+    return facet_cache
+
+@app.route('/api/facets')
+def api_facets():
+    # Subjects and goals with group and open-group counts, in one call
+    body, etag = get_facet_cache().get_response()
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = FACETS_MAX_AGE
+    return response
+
 @app.route('/api/subjects')
 def api_subjects():
-    conn = get_db_connection()
-    subjects = conn.execute('''
-        SELECT DISTINCT subject FROM study_groups WHERE subject IS NOT NULL AND subject != ''
-    ''').fetchall()
-    conn.close()
+    subjects = get_facet_cache().facets('subjects')
     
-    return jsonify([{'subject': s['subject']} for s in subjects])
+    return jsonify([{'subject': subject} for subject, groups, open_groups in subjects])
 
 @app.route('/api/goals')
 def api_goals():
-    conn = get_db_connection()
-    goals = conn.execute('''
-        SELECT DISTINCT goal FROM study_groups WHERE goal IS NOT NULL AND goal != ''
-    ''').fetchall()
-    conn.close()
+    goals = get_facet_cache().facets('goals')
     
-    return jsonify([{'goal': g['goal']} for g in goals])
+    return jsonify([{'goal': goal} for goal, groups, open_groups in goals])
+
+@app.route('/api/compatibility')
+def api_compatibility():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    # Comma-separated group ids, e.g. one page of /find-group results
+    try:
+        group_ids = [int(group_id) for group_id in request.args.get('group_ids', '').split(',') if group_id.strip()]
+    except ValueError:
+        return jsonify({'error': 'group_ids must be a comma-separated list of integers'}), 400
+
+    if len(group_ids) > MAX_COMPATIBILITY_GROUPS:
+        return jsonify({'error': f'At most {MAX_COMPATIBILITY_GROUPS} groups per request'}), 400
+
+    results = matching_engine.get_group_compatibility_many(session['user_id'], group_ids)
+
+    return jsonify({'compatibility': [{
+        'group_id': group_id,
+        'final_score': results[group_id]['final_score'],
+        'rules_score': results[group_id]['rules_score'],
+        'cf_score': results[group_id]['cf_score']
+    } for group_id in group_ids if group_id in results]})
 
 @app.route('/admin-login', methods=['GET', 'POST'])
 def admin_login():
@@ -794,6 +1266,73 @@ def admin_login():
         return render_template('admin-login.html')
 
 # Admin routes
+# Admin table pages: the columns each JSON list returns and the ones it
+# can be sorted by (name -> SQL expression)
+ADMIN_USER_COLUMNS = ['id', 'student_id', 'name', 'email', 'is_admin', 'created_at']
+ADMIN_USER_SORTS = {
+    'id': 'id', 'student_id': 'student_id', 'name': 'name',
+    'email': 'email', 'is_admin': 'is_admin', 'created_at': 'created_at'
+}
+ADMIN_GROUP_COLUMNS = ['id', 'name', 'subject', 'goal', 'date', 'time', 'location',
+                       'current_members', 'max_members', 'created_by', 'created_at']
+ADMIN_GROUP_SORTS = {
+    'id': 'id', 'name': 'name', 'subject': 'subject', 'goal': 'goal', 'date': 'date_iso',
+    'current_members': 'current_members', 'max_members': 'max_members',
+    'created_by': 'created_by', 'created_at': 'created_at'
+}
+ADMIN_PAGE_SIZE = 50
+MAX_ADMIN_PAGE_SIZE = 500
+
+def wants_admin_json():
+    return request.args.get('format') == 'json' or request.is_json or \
+        (request.headers.get('Content-Type') and 'application/json' in request.headers.get('Content-Type'))
+
+def admin_page_queries(table, columns, sort_expression, order, conditions):
+    """
+    (count sql, page sql) of an admin table page; the page sql takes the
+    conditions' parameters followed by LIMIT and OFFSET
+    """
+    where = ' AND '.join(conditions) if conditions else '1=1'
+    return (
+        f'SELECT COUNT(*) FROM {table} WHERE {where}',
+        f'SELECT {", ".join(columns)} FROM {table} WHERE {where} '
+        f'ORDER BY {sort_expression} {order}, id {order} LIMIT ? OFFSET ?'
+    )
+
+def admin_table_page(table, columns, sorts, conditions, params):
+    """
+    One page of an admin table as a JSON response: ?page (from 1),
+    ?page_size, ?sort (a key of sorts) and ?order (asc or desc), filtered
+    by the SQL conditions. Ties are broken by id so pages don't overlap
+    """
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', ADMIN_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page and page_size must be integers'}), 400
+    if page < 1 or not 1 <= page_size <= MAX_ADMIN_PAGE_SIZE:
+        return jsonify({'error': f'page must be at least 1 and page_size between 1 and {MAX_ADMIN_PAGE_SIZE}'}), 400
+    
+    sort = request.args.get('sort', 'created_at')
+    order = request.args.get('order', 'desc').lower()
+    if sort not in sorts or order not in ('asc', 'desc'):
+        return jsonify({'error': f"sort must be one of {', '.join(sorts)} and order asc or desc"}), 400
+    
+    count_query, page_query = admin_page_queries(table, columns, sorts[sort], order, conditions)
+    conn = get_db_connection()
+    total = conn.execute(count_query, params).fetchone()[0]
+    rows = conn.execute(page_query, params + [page_size, (page - 1) * page_size]).fetchall()
+    conn.close()
+    
+    return jsonify({
+        'items': [dict(row) for row in rows],
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'sort': sort,
+        'order': order
+    })
+
 @app.route('/admin')
 def admin_dashboard():
     if session.get('role') != 'admin':
@@ -801,12 +1340,13 @@ def admin_dashboard():
             return jsonify({'error': 'Admin access required'}), 401
         return redirect(url_for('login'))
     
+    # Only the totals; the tables load their pages from /admin/users and /admin/groups
     conn = get_db_connection()
-    groups = conn.execute('SELECT * FROM study_groups ORDER BY created_at DESC').fetchall()
-    users = conn.execute('SELECT * FROM users ORDER BY created_at DESC').fetchall()
+    user_count = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    group_count = conn.execute('SELECT COUNT(*) FROM study_groups').fetchone()[0]
     conn.close()
     
-    return render_template('admin-dashboard.html', groups=groups, users=users, view='dashboard')
+    return render_template('admin-dashboard.html', user_count=user_count, group_count=group_count, view='dashboard')
 
 
 @app.route('/admin/users')
@@ -816,11 +1356,16 @@ def admin_users():
             return jsonify({'error': 'Admin access required'}), 401
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    users = conn.execute('SELECT * FROM users ORDER BY created_at DESC').fetchall()
-    conn.close()
+    if not wants_admin_json():
+        return render_template('admin-dashboard.html', view='users')
+    
+    # ?q= matches student ID, name or email
+    conditions, params = [], []
+    if request.args.get('q'):
+        conditions.append('(student_id LIKE ? OR name LIKE ? OR email LIKE ?)')
+        params.extend([f"%{request.args['q']}%"] * 3)
     
-    return render_template('admin-dashboard.html', users=users, view='users')
+    return admin_table_page('users', ADMIN_USER_COLUMNS, ADMIN_USER_SORTS, conditions, params)
 
 
 @app.route('/admin/groups')
@@ -830,11 +1375,20 @@ def admin_groups():
             return jsonify({'error': 'Admin access required'}), 401
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    groups = conn.execute('SELECT * FROM study_groups ORDER BY created_at DESC').fetchall()
-    conn.close()
+    if not wants_admin_json():
+        return render_template('admin-dashboard.html', view='groups')
+    
+    # ?q= matches name or location; subject and goal are exact filters
+    conditions, params = [], []
+    if request.args.get('q'):
+        conditions.append('(name LIKE ? OR location LIKE ?)')
+        params.extend([f"%{request.args['q']}%"] * 2)
+    for column in ('subject', 'goal'):
+        if request.args.get(column) and request.args[column] != 'all':
+            conditions.append(f'{column} = ?')
+            params.append(request.args[column])
     
-    return render_template('admin-dashboard.html', groups=groups, view='groups')
+    return admin_table_page('study_groups', ADMIN_GROUP_COLUMNS, ADMIN_GROUP_SORTS, conditions, params)
 
 
 @app.route('/admin/users/<int:user_id>', methods=['DELETE'])
@@ -848,13 +1402,18 @@ def delete_user(user_id):
         # Begin transaction
         conn.execute('BEGIN IMMEDIATE')
         
-        # Delete user's group memberships
-        conn.execute('DELETE FROM group_members WHERE user_id = ?', (user_id,))
+        # Give back the user's places in the groups they joined, then delete the memberships
+        changed_groups = conn.execute(
+            'UPDATE study_groups SET current_members = MAX(current_members - 1, 0) WHERE id IN (SELECT group_id FROM group_members WHERE user_id = ?) RETURNING id, current_members, max_members',
+            (user_id,)
+        ).fetchall()
+        conn.execute(DELETE_USER_MEMBERSHIPS_QUERY, (user_id,))
         
         # Delete user's preferences
         conn.execute('DELETE FROM user_preferences WHERE user_id = ?', (user_id,))
         
         # Delete study groups created by this user
+        deleted_groups = conn.execute('SELECT id FROM study_groups WHERE created_by = (SELECT student_id FROM users WHERE id = ?)', (user_id,)).fetchall()
         conn.execute('DELETE FROM study_groups WHERE created_by = (SELECT student_id FROM users WHERE id = ?)', (user_id,))
         
         # Finally, delete the user
@@ -863,6 +1422,18 @@ def delete_user(user_id):
         conn.commit()
         conn.close()
         
+        matching_engine.user_removed(user_id)
+        for group in changed_groups:
+            facet_cache.group_updated(group['id'], group['current_members'], group['max_members'])
+        for group in deleted_groups:
+            matching_engine.group_removed(group['id'])
+            facet_cache.group_removed(group['id'])
+        response_cache.bump(
+            ('user', user_id),
+            *[('group', group['id']) for group in changed_groups],
+            *[('group', group['id']) for group in deleted_groups]
+        )
+        
         return jsonify({'message': 'User deleted successfully'})
     except Exception as e:
         conn.rollback()
@@ -881,7 +1452,7 @@ def delete_group(group_id):
         conn.execute('BEGIN IMMEDIATE')
         
         # Delete group members
-        conn.execute('DELETE FROM group_members WHERE group_id = ?', (group_id,))
+        conn.execute(DELETE_GROUP_MEMBERS_QUERY, (group_id,))
         
         # Delete the study group
         conn.execute('DELETE FROM study_groups WHERE id = ?', (group_id,))
@@ -889,12 +1460,113 @@ def delete_group(group_id):
         conn.commit()
         conn.close()
         
+        matching_engine.group_removed(group_id)
+        facet_cache.group_removed(group_id)
+        response_cache.bump(('group', group_id))
+        
         return jsonify({'message': 'Group deleted successfully'})
     except Exception as e:
         conn.rollback()
         conn.close()
         return jsonify({'error': 'Failed to delete group'}), 500
 
+@app.route('/admin/matching-stats')
+def admin_matching_stats():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required'}), 401
+    
+    return jsonify({
+        'profile_cache': matching_engine.profile_cache.stats(),
+        'membership_index': matching_engine.index.stats(),
+        'connection_pool': db_pool.stats(),
+        'write_batcher': write_batcher.stats() if write_batcher is not None else None,
+        'response_cache': response_cache.stats(),
+        'password_hasher': password_hasher.stats()
+    })
+
+# Full lists streamed by /admin/export/<name> as newline-delimited JSON
+EXPORT_QUERIES = {
+    'groups': '''
+        SELECT g.id, g.name, g.subject, g.description, g.goal, g.date, g.time, g.location,
+               g.current_members, g.max_members, u.student_id as creator, g.created_at
+        FROM study_groups g
+        LEFT JOIN users u ON g.created_by = u.id
+        ORDER BY g.id
+    ''',
+    'memberships': '''
+        SELECT gm.group_id, gm.user_id, u.student_id, gm.joined_at
+        FROM group_members gm
+        JOIN users u ON gm.user_id = u.id
+        ORDER BY gm.id
+    ''',
+}
+EXPORT_CHUNK_ROWS = 1000
+
+def export_ndjson_chunks(conn, sql, compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield a query's rows as newline-delimited JSON, chunk_rows rows at a
+    time (gzipped if compress), so memory use doesn't grow with the number
+    of rows. Closes conn when done
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip framing
+    try:
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            chunk = ''.join(json.dumps(dict(row)) + '\n' for row in rows).encode()
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        conn.close()
+
+@app.route('/admin/export/<name>')
+def admin_export(name):
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required'}), 401
+    if name not in EXPORT_QUERIES:
+        return jsonify({'error': f"Unknown export, expected one of {', '.join(EXPORT_QUERIES)}"}), 404
+    
+    # gzip when the client accepts it; ?gzip=0 turns it off
+    compress = request.args.get('gzip') != '0' and \
+        request.accept_encodings.best_match(['gzip', 'identity']) == 'gzip'
+    
+    # The generator owns the connection; its single read runs on one
+    # snapshot, so the export is consistent without blocking writers (WAL)
+    response = Response(
+        stream_with_context(export_ndjson_chunks(get_db_connection(), EXPORT_QUERIES[name], compress)),
+        mimetype='application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.ndjson'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/admin/analytics')
+def admin_analytics():
+    if session.get('role') != 'admin':
+        return jsonify({'error': 'Admin access required'}), 401
+    
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({'error': 'days must be an integer'}), 400
+    if not 1 <= days <= MAX_ANALYTICS_DAYS:
+        return jsonify({'error': f'days must be between 1 and {MAX_ANALYTICS_DAYS}'}), 400
+    
+    # Read from the rollups only (see analytics.py)
+    conn = get_db_connection()
+    analytics = get_analytics(conn, days)
+    conn.close()
+    
+    return jsonify(analytics)
+
 @app.route('/auto-match', methods=['POST'])
 def auto_match():
     if 'user_id' not in session:
@@ -911,9 +1583,11 @@ def auto_match():
     if not user_prefs:
         return jsonify({'error': 'User preferences not set'})
     
-    # Use the matching engine to find compatible groups
-    engine = MatchingEngine()
-    recommendations = engine.get_recommendations(user_id=session['user_id'])
+    # Serve precomputed recommendations, falling back to live scoring
+    # when the user's list is stale or missing
+    recommendations = matching_engine.get_precomputed_recommendations(user_id=session['user_id'])
+    if recommendations is None:
+        recommendations = matching_engine.get_recommendations(user_id=session['user_id'])
     
     # Format the recommendations for the frontend
     formatted_recommendations = []
@@ -940,5 +1614,6 @@ def auto_match():
 
 if __name__ == '__main__':
     ensure_db_exists()  # Ensure database and tables exist
+    matching_engine.load_index()  # Load the membership index once at startup
     app.run(debug=True)
     
\ No newline at end of file
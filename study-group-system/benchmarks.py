@@ -0,0 +1,685 @@
+"""
+Load benchmarks for the study group system, run against throwaway
+databases in a temporary directory:
+
+    python benchmarks.py concurrency [--seconds 5] [--readers 8] [--writers 2]
+    python benchmarks.py query-plans
+    python benchmarks.py date-filter [--groups 200000] [--repeat 20]
+    python benchmarks.py search [--sizes 10000,40000,160000] [--repeat 20]
+    python benchmarks.py join-stress [--processes 8] [--seconds 5] [--groups 10] [--capacity 5]
+    python benchmarks.py write-batching [--threads 32] [--seconds 5]
+    python benchmarks.py view-group [--members 10,100,1000] [--repeat 500]
+    python benchmarks.py analytics [--sizes 2000,20000,100000] [--repeat 20]
+    python benchmarks.py login [--workers 0,1,2,4] [--threads 32] [--seconds 5]
+    python benchmarks.py export [--sizes 10000,100000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from analytics import DAILY_STATS_QUERY, get_analytics
+from app import (
+    ADMIN_GROUP_COLUMNS, ADMIN_USER_COLUMNS, DEFAULT_FIND_GROUP_FIELDS, DELETE_GROUP_MEMBERS_QUERY,
+    DELETE_USER_MEMBERSHIPS_QUERY, EXPORT_QUERIES, GROUP_ACCESS_QUERY, JOIN_GROUP_QUERY,
+    JOIN_STATUS_QUERY, LEAVE_GROUP_QUERY, MY_CREATED_GROUPS_QUERY, MY_JOINED_GROUPS_QUERY,
+    PASSWORD_HASH_METHOD, USER_BY_STUDENT_ID_QUERY, VIEW_GROUP_QUERY, add_member, admin_page_queries,
+    export_ndjson_chunks, find_group_columns, find_group_query, init_db, remove_member
+)
+from database import ConnectionPool, DEFAULT_PRAGMAS, WriteBatcher
+from matching_engine import (
+    CHANGED_GROUPS_QUERY, GROUPS_BY_ID_QUERY, LAST_REFRESH_QUERY, MEMBERSHIP_CHANGES_QUERY,
+    PRECOMPUTED_RECOMMENDATIONS_QUERY, RECOMMENDATION_CANDIDATES_QUERY, RECOMMENDATION_STALENESS_QUERY,
+    RECOMMENDATION_STATE_QUERY, SYNC_GROUPS_QUERY, SYNC_MEMBERS_QUERY
+)
+from passwords import PasswordHasher
+
+SUBJECTS = ['math101', 'prog101', 'bus101', 'stats101', 'eng101', 'phy101', 'chem101', 'bio101']
+GOALS = ['midterm', 'homework', 'project', 'final', 'assignment']
+# Words for synthetic group descriptions
+TOPICS = ['algebra', 'calculus', 'vectors', 'recursion', 'pointers', 'databases', 'marketing',
+          'accounting', 'regression', 'probability', 'essays', 'grammar', 'kinematics', 'optics',
+          'titration', 'genetics', 'revision', 'past', 'papers', 'notes', 'quiz', 'lab', 'report',
+          'slides', 'presentation', 'flashcards', 'exercises', 'tutorial', 'chapter', 'review']
+
+
+# Hot queries from app.py, matching_engine.py and analytics.py: (name, sql),
+# built from the SQL the app itself runs. Parameters are all bound to 1,
+# or to [1] when they feed json_each
+FIND_GROUP_JSON_COLUMNS = find_group_columns(DEFAULT_FIND_GROUP_FIELDS)
+ADMIN_GROUPS_COUNT, ADMIN_GROUPS_PAGE = admin_page_queries('study_groups', ADMIN_GROUP_COLUMNS, 'created_at', 'desc', [])
+_, ADMIN_GROUPS_SUBJECT_PAGE = admin_page_queries('study_groups', ADMIN_GROUP_COLUMNS, 'created_at', 'desc', ['subject = ?'])
+_, ADMIN_USERS_PAGE = admin_page_queries('users', ADMIN_USER_COLUMNS, 'created_at', 'desc', [])
+
+HOT_QUERIES = [
+    ('login', USER_BY_STUDENT_ID_QUERY),
+    ('find_group all', find_group_query(FIND_GROUP_JSON_COLUMNS)[0]),
+    ('find_group subject', find_group_query(FIND_GROUP_JSON_COLUMNS, subject='math101')[0]),
+    ('find_group goal', find_group_query(FIND_GROUP_JSON_COLUMNS, goal='final')[0]),
+    ('find_group today', find_group_query(FIND_GROUP_JSON_COLUMNS, date_range=('2026-06-01', '2026-06-01'))[0]),
+    ('find_group week', find_group_query(FIND_GROUP_JSON_COLUMNS, date_range=('2026-06-01', '2026-06-07'))[0]),
+    ('find_group page', find_group_query(FIND_GROUP_JSON_COLUMNS, limit=51, cursor=('2026-06-01', 1))[0]),
+    ('find_group subject page', find_group_query(FIND_GROUP_JSON_COLUMNS, subject='math101', limit=51, cursor=('2026-06-01', 1))[0]),
+    ('find_group search page', find_group_query(FIND_GROUP_JSON_COLUMNS, search_match='"math"*', limit=51, snapshot_id=1, offset=50)[0]),
+    ('my_groups joined', MY_JOINED_GROUPS_QUERY),
+    ('my_groups created', MY_CREATED_GROUPS_QUERY),
+    ('join_group', JOIN_GROUP_QUERY),
+    ('join_group status', JOIN_STATUS_QUERY),
+    ('view_group access', GROUP_ACCESS_QUERY),
+    ('view_group', VIEW_GROUP_QUERY),
+    ('leave_group', LEAVE_GROUP_QUERY),
+    ('delete group members', DELETE_GROUP_MEMBERS_QUERY),
+    ('delete user memberships', DELETE_USER_MEMBERSHIPS_QUERY),
+    ('admin groups count', ADMIN_GROUPS_COUNT),
+    ('admin groups page', ADMIN_GROUPS_PAGE),
+    ('admin groups subject page', ADMIN_GROUPS_SUBJECT_PAGE),
+    ('admin users page', ADMIN_USERS_PAGE),
+    ('analytics days', DAILY_STATS_QUERY),
+    ('recommendation candidates', RECOMMENDATION_CANDIDATES_QUERY),
+    ('group compatibility', GROUPS_BY_ID_QUERY),
+    ('precomputed run', LAST_REFRESH_QUERY),
+    ('precomputed state', RECOMMENDATION_STATE_QUERY),
+    ('precomputed staleness', RECOMMENDATION_STALENESS_QUERY),
+    ('precomputed changed groups', CHANGED_GROUPS_QUERY),
+    ('precomputed list', PRECOMPUTED_RECOMMENDATIONS_QUERY),
+    ('index sync changes', MEMBERSHIP_CHANGES_QUERY),
+    ('index sync groups', SYNC_GROUPS_QUERY),
+    ('index sync members', SYNC_MEMBERS_QUERY),
+]
+
+# SCAN steps that never read a table: the json_each id lists bound as
+# parameters, the FTS5 index and subqueries the query already narrowed down
+SCAN_ALWAYS_ALLOWED = re.compile(r'^SCAN (json_each VIRTUAL TABLE|study_groups_fts VIRTUAL TABLE|\(subquery-\d+\))')
+# Any other SCAN step must be listed here with the reason it is intended:
+# (query name, exact plan step) -> reason
+SCAN_ALLOWED = {
+    ('find_group all', 'SCAN g USING INDEX idx_study_groups_created_at'):
+        'the unpaginated JSON listing returns every group, newest first',
+    ('admin groups count', 'SCAN study_groups USING COVERING INDEX idx_study_groups_created_at'):
+        'the total for the admin pager counts every group',
+    ('admin groups page', 'SCAN study_groups USING INDEX idx_study_groups_created_at'):
+        'walks the sort index and stops after LIMIT + OFFSET rows',
+    ('admin users page', 'SCAN users USING INDEX idx_users_created_at'):
+        'walks the sort index and stops after LIMIT + OFFSET rows',
+    ('recommendation candidates', 'SCAN sg USING INDEX idx_study_groups_open'):
+        'every open group is a candidate; the partial index skips full ones',
+    ('precomputed run', 'SCAN recommendation_runs USING INDEX idx_recommendation_runs_finished'):
+        'the newest finished run, LIMIT 1 off the partial index',
+}
+
+
+def create_database(path, wal=True, users=2000, groups=2000, memberships=True):
+    """
+    Create a database with the app schema and synthetic users and groups
+    """
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    init_db(conn, wal=wal)
+
+    rng = random.Random(1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO users (student_id, name, email, password_hash) VALUES (?, ?, ?, ?)',
+        [(f'S{i:07d}', f'Student {i}', f's{i}@student.inti.edu.my', 'x') for i in range(1, users + 1)]
+    )
+    conn.executemany(
+        'INSERT INTO study_groups (name, subject, description, goal, date, date_iso, time, location, max_members, created_by) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'Group {i}', rng.choice(SUBJECTS), ' '.join(rng.sample(TOPICS, 4)), rng.choice(GOALS),
+          *[f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'] * 2, '9:00am', 'Library',
+          rng.choice([4, 8, 10, 30]), rng.randint(1, users)) for i in range(1, groups + 1)]
+    )
+
+    # Fill groups to a random level, a fair share of them up to capacity
+    if memberships:
+        rows = []
+        for group in conn.execute('SELECT id, max_members FROM study_groups').fetchall():
+            size = min(group[1], rng.randint(1, group[1] * 2))
+            rows.extend((user_id, group[0]) for user_id in rng.sample(range(1, users + 1), size))
+        conn.executemany('INSERT INTO group_members (user_id, group_id) VALUES (?, ?)', rows)
+        conn.execute('UPDATE study_groups SET current_members = (SELECT COUNT(*) FROM group_members WHERE group_id = study_groups.id)')
+    conn.commit()
+    conn.close()
+
+
+def run_threads(workers, seconds):
+    """
+    Run each worker(stop_event, counters) in its own thread for `seconds`
+    """
+    stop = threading.Event()
+    counters = [{'ops': 0, 'errors': 0} for _ in workers]
+    threads = [
+        threading.Thread(target=worker, args=(stop, counter))
+        for worker, counter in zip(workers, counters)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counters
+
+
+def concurrency_benchmark(path, pool, seconds, readers, writers, users=2000, groups=2000):
+    """
+    Readers run the /find-group query while writers run the join_group
+    writes; returns reads/s, writes/s and lock errors
+    """
+    def reader(stop, counter):
+        rng = random.Random()
+        while not stop.is_set():
+            conn = pool.connect()
+            try:
+                conn.execute(
+                    'SELECT g.*, u.student_id as creator FROM study_groups g JOIN users u ON g.created_by = u.id WHERE g.subject = ?',
+                    (rng.choice(SUBJECTS),)
+                ).fetchall()
+                counter['ops'] += 1
+            except sqlite3.OperationalError:
+                counter['errors'] += 1
+            finally:
+                conn.close()
+
+    def writer(stop, counter):
+        rng = random.Random()
+        while not stop.is_set():
+            conn = pool.connect()
+            group_id = rng.randint(1, groups)
+            try:
+                conn.execute(
+                    'INSERT OR IGNORE INTO group_members (user_id, group_id) VALUES (?, ?)',
+                    (rng.randint(1, users), group_id)
+                )
+                conn.execute(
+                    'UPDATE study_groups SET current_members = current_members + 1 WHERE id = ?',
+                    (group_id,)
+                )
+                conn.commit()
+                counter['ops'] += 1
+            except sqlite3.OperationalError:
+                counter['errors'] += 1
+            finally:
+                conn.close()
+
+    counters = run_threads([reader] * readers + [writer] * writers, seconds)
+    read_counters, write_counters = counters[:readers], counters[readers:]
+    return {
+        'reads_per_sec': sum(c['ops'] for c in read_counters) / seconds,
+        'writes_per_sec': sum(c['ops'] for c in write_counters) / seconds,
+        'errors': sum(c['errors'] for c in counters)
+    }
+
+
+def concurrency(args):
+    configurations = [
+        # The previous setup: rollback journal and SQLite's default pragmas
+        ('rollback journal, default pragmas', False, {}),
+        ('WAL, tuned pragmas', True, DEFAULT_PRAGMAS),
+    ]
+
+    print(f'{args.readers} readers, {args.writers} writers, {args.seconds}s per run')
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, wal, pragmas in configurations:
+            path = os.path.join(tmp, f"{'wal' if wal else 'rollback'}.db")
+            create_database(path, wal=wal)
+            pool = ConnectionPool(path, max_idle=args.readers + args.writers, pragmas=pragmas)
+            result = concurrency_benchmark(path, pool, args.seconds, args.readers, args.writers)
+            pool.close_all()
+            print(f"{name:<36} reads/s {result['reads_per_sec']:>9.1f}  "
+                  f"writes/s {result['writes_per_sec']:>8.1f}  lock errors {result['errors']}")
+
+
+def check_query_plans():
+    """
+    [(name, plan steps, unexpected SCAN steps)] for HOT_QUERIES, planned
+    against a synthetic database
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'plans.db')
+        create_database(path)
+        conn = sqlite3.connect(path)
+        conn.execute('ANALYZE')
+
+        for name, sql in HOT_QUERIES:
+            params = ['[1]' if part.endswith('json_each(') else 1 for part in sql.split('?')[:-1]]
+            plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            scans = [
+                step for step in plan
+                if step.startswith('SCAN ') and not SCAN_ALWAYS_ALLOWED.match(step)
+                and (name, step) not in SCAN_ALLOWED
+            ]
+            results.append((name, plan, scans))
+        conn.close()
+    return results
+
+
+def query_plans(args):
+    failures = 0
+    for name, plan, scans in check_query_plans():
+        failures += bool(scans)
+        print(f"{'FAIL' if scans else 'ok':<5}{name}: {'; '.join(plan)}")
+
+    if failures:
+        print(f'{failures} queries have a SCAN step that is not in SCAN_ALLOWED')
+        sys.exit(1)
+
+
+def date_filter(args):
+    # The /find-group "this week" filter before and after date_iso. date(g.date)
+    # has no index, so every row's date string is parsed on every request
+    queries = [
+        ('date(g.date) BETWEEN', 'SELECT g.*, u.student_id as creator FROM study_groups g JOIN users u ON g.created_by = u.id WHERE 1=1 AND date(g.date) BETWEEN date(?) AND date(?)'),
+        ('g.date_iso BETWEEN', 'SELECT g.*, u.student_id as creator FROM study_groups g JOIN users u ON g.created_by = u.id WHERE 1=1 AND g.date_iso BETWEEN ? AND ?'),
+    ]
+    params = ('2026-06-01', '2026-06-07')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'dates.db')
+        create_database(path, groups=args.groups)
+        conn = sqlite3.connect(path)
+        conn.execute('ANALYZE')
+
+        results = []
+        print(f'{args.groups} groups, {args.repeat} queries each')
+        for name, sql in queries:
+            plan = '; '.join(row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params))
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = conn.execute(sql, params).fetchall()
+            elapsed = (time.perf_counter() - start) / args.repeat
+            results.append(sorted(tuple(row) for row in rows))
+            print(f'{name:<22} {elapsed * 1000:>8.2f} ms/query  {len(rows)} rows  ({plan})')
+        conn.close()
+
+    if results[0] != results[1]:
+        print('date_iso returned different rows from date(g.date)')
+        sys.exit(1)
+
+
+def search(args):
+    # One page of /find-group?q= results against a LIKE scan over the same
+    # columns. A rare term (one group name) should cost the same at any size;
+    # a common one grows with the number of matches that bm25 has to rank
+    search_sql = 'SELECT g.id, bm25(study_groups_fts, 10.0, 5.0, 1.0, 5.0, 2.0) AS cursor_key FROM study_groups_fts JOIN study_groups g ON g.id = study_groups_fts.rowid JOIN users u ON g.created_by = u.id WHERE study_groups_fts MATCH ? ORDER BY cursor_key, g.id LIMIT 51'
+    like_sql = "SELECT g.id FROM study_groups g JOIN users u ON g.created_by = u.id WHERE g.name LIKE ?1 OR g.subject LIKE ?1 OR g.description LIKE ?1 OR g.goal LIKE ?1 OR g.location LIKE ?1 ORDER BY g.created_at DESC, g.id DESC LIMIT 51"
+    terms = [('rare', '"777"', '%777%'), ('common', '"titration"', '%titration%')]
+
+    print(f'{args.repeat} queries each, ms/query')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            path = os.path.join(tmp, f'search-{size}.db')
+            create_database(path, groups=size, memberships=False)
+            conn = sqlite3.connect(path)
+            for name, match, pattern in terms:
+                timings = []
+                for sql, param in ((search_sql, match), (like_sql, pattern)):
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        conn.execute(sql, (param,)).fetchall()
+                    timings.append((time.perf_counter() - start) / args.repeat * 1000)
+                print(f'{size:>8} groups  {name:<7} fts5 {timings[0]:>8.2f}  LIKE {timings[1]:>8.2f}')
+            conn.close()
+
+
+def join_stress_worker(path, seconds, users, groups, leave_ratio, seed, results):
+    """
+    One process of join-stress: random joins and leaves through add_member and
+    remove_member until the time is up, then report the status counts
+    """
+    pool = ConnectionPool(path, max_idle=1)
+    rng = random.Random(seed)
+    counts = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        user_id, group_id = rng.randint(1, users), rng.randint(1, groups)
+        conn = pool.connect()
+        try:
+            if rng.random() < leave_ratio:
+                status, group = remove_member(conn, user_id, group_id)
+            else:
+                status, group = add_member(conn, user_id, group_id)
+        except sqlite3.OperationalError:
+            status = 'locked'
+        finally:
+            conn.close()
+        counts[status] = counts.get(status, 0) + 1
+    pool.close_all()
+    results.put(counts)
+
+
+def join_stress(args):
+    # Many processes joining and leaving a few small groups: no group may
+    # ever hold more members than max_members, and current_members must
+    # always match the member rows
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'joins.db')
+        create_database(path, users=args.users, groups=args.groups, memberships=False)
+        conn = sqlite3.connect(path)
+        conn.execute('UPDATE study_groups SET max_members = ?', (args.capacity,))
+        conn.commit()
+        conn.close()
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=join_stress_worker, args=(
+                path, args.seconds, args.users, args.groups, args.leave_ratio, seed, results
+            ))
+            for seed in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        totals = {}
+        for _ in processes:
+            for status, count in results.get().items():
+                totals[status] = totals.get(status, 0) + count
+        for process in processes:
+            process.join()
+
+        conn = sqlite3.connect(path)
+        groups = conn.execute('''
+            SELECT g.id, g.max_members, g.current_members, COUNT(gm.id)
+            FROM study_groups g LEFT JOIN group_members gm ON gm.group_id = g.id
+            GROUP BY g.id
+        ''').fetchall()
+        conn.close()
+
+    overfilled = [group for group in groups if group[3] > group[1]]
+    miscounted = [group for group in groups if group[3] != group[2]]
+    operations = sum(totals.values())
+    print(f'{args.processes} processes, {args.groups} groups of {args.capacity}, {args.seconds}s')
+    print(f'{operations / args.seconds:.1f} operations/s  ' +
+          '  '.join(f'{status} {count}' for status, count in sorted(totals.items())))
+    print(f'fullest group {max(group[3] for group in groups)}/{args.capacity}  '
+          f'overfilled {len(overfilled)}  miscounted {len(miscounted)}')
+    if overfilled or miscounted:
+        sys.exit(1)
+
+
+def write_batching(args):
+    # Request threads joining random groups, each join committed on its own
+    # (with and without an fsync on every commit) or through a WriteBatcher,
+    # whose own connection always syncs every commit
+    configurations = [
+        ('synchronous=NORMAL', 'NORMAL', False),
+        ('synchronous=FULL', 'FULL', False),
+        ('synchronous=FULL', 'NORMAL', True),
+    ]
+
+    print(f'{args.threads} threads, {args.seconds}s per run')
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, synchronous, batched in configurations:
+            path = os.path.join(tmp, f"{synchronous}-{'batched' if batched else 'direct'}.db")
+            create_database(path, users=args.users, groups=args.groups, memberships=False)
+            conn = sqlite3.connect(path)
+            conn.execute('UPDATE study_groups SET max_members = ?', (args.users,))
+            conn.commit()
+            conn.close()
+
+            pool = ConnectionPool(path, max_idle=args.threads + 1, pragmas=dict(DEFAULT_PRAGMAS, synchronous=synchronous))
+            batcher = WriteBatcher(pool, interval=args.interval / 1000) if batched else None
+
+            def joiner(stop, counter):
+                rng = random.Random()
+                while not stop.is_set():
+                    user_id, group_id = rng.randint(1, args.users), rng.randint(1, args.groups)
+                    try:
+                        if batcher is not None:
+                            status, group = batcher.submit(lambda conn: add_member(conn, user_id, group_id, commit=False))
+                        else:
+                            conn = pool.connect()
+                            try:
+                                status, group = add_member(conn, user_id, group_id)
+                            finally:
+                                conn.close()
+                        counter['ops'] += 1
+                    except sqlite3.OperationalError:
+                        counter['errors'] += 1
+
+            counters = run_threads([joiner] * args.threads, args.seconds)
+            joins = sum(counter['ops'] for counter in counters)
+            if batcher is not None:
+                batcher.stop()
+                commits = batcher.stats()['commits']
+            else:
+                commits = joins
+            pool.close_all()
+            print(f"{name:<20} {'batched' if batched else 'direct':<8} joins/s {joins / args.seconds:>9.1f}  "
+                  f"commits/s {commits / args.seconds:>8.1f}  errors {sum(c['errors'] for c in counters)}")
+
+
+def view_group(args):
+    # Database time for one /group/<id> view (no response cache): the
+    # previous four queries against the access check plus VIEW_GROUP_QUERY,
+    # with and without a member limit
+    def four_queries(conn, user_id, group_id):
+        conn.execute('SELECT 1 FROM group_members WHERE user_id = ? AND group_id = ?', (user_id, group_id)).fetchone()
+        conn.execute('SELECT 1 FROM study_groups WHERE id = ? AND created_by = ?', (group_id, user_id)).fetchone()
+        conn.execute('SELECT sg.*, u.student_id as creator FROM study_groups sg JOIN users u ON sg.created_by = u.id WHERE sg.id = ?', (group_id,)).fetchone()
+        conn.execute('SELECT u.student_id, u.name FROM users u JOIN group_members gm ON u.id = gm.user_id WHERE gm.group_id = ? ORDER BY u.name', (group_id,)).fetchall()
+
+    def single_query(limit):
+        def run(conn, user_id, group_id):
+            conn.execute(GROUP_ACCESS_QUERY, (user_id, group_id)).fetchone()
+            group = conn.execute(VIEW_GROUP_QUERY, (limit, group_id)).fetchone()
+            sorted(json.loads(group['members']), key=lambda member: member['name'])
+        return run
+
+    flows = [
+        ('four queries', four_queries),
+        ('access + page', single_query(-1)),
+        ('access + page, limit 20', single_query(20)),
+    ]
+
+    sizes = [int(size) for size in args.members.split(',')]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'view.db')
+        create_database(path, users=max(sizes), groups=len(sizes), memberships=False)
+        conn = sqlite3.connect(path)
+        for group_id, size in enumerate(sizes, start=1):
+            conn.executemany('INSERT INTO group_members (user_id, group_id) VALUES (?, ?)',
+                             [(user_id, group_id) for user_id in range(1, size + 1)])
+            conn.execute('UPDATE study_groups SET max_members = ?, current_members = ? WHERE id = ?', (size, size, group_id))
+        conn.commit()
+        conn.close()
+
+        pool = ConnectionPool(path, max_idle=1)
+        print(f'{args.repeat} views each, ms/view')
+        for group_id, size in enumerate(sizes, start=1):
+            for name, flow in flows:
+                conn = pool.connect()
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    flow(conn, 1, group_id)
+                elapsed = (time.perf_counter() - start) / args.repeat
+                conn.close()
+                print(f'{size:>6} members  {name:<24} {elapsed * 1000:>7.3f}')
+        pool.close_all()
+
+
+def analytics(args):
+    # /admin/analytics from the rollups against the same figures computed
+    # ad hoc from study_groups and group_members. The rollups should cost
+    # the same at any size
+    def ad_hoc(conn):
+        conn.execute('''
+            SELECT subject, COUNT(*), SUM(current_members >= max_members), SUM(current_members), SUM(max_members)
+            FROM study_groups GROUP BY subject
+        ''').fetchall()
+        conn.execute('''
+            SELECT date(gm.joined_at) AS day, g.subject, COUNT(*)
+            FROM group_members gm JOIN study_groups g ON g.id = gm.group_id
+            WHERE gm.joined_at >= date('now', '-29 days')
+            GROUP BY day, g.subject
+        ''').fetchall()
+
+    print(f'{args.repeat} queries each, ms/query')
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            path = os.path.join(tmp, f'analytics-{size}.db')
+            create_database(path, users=max(2000, size // 10), groups=size)
+            pool = ConnectionPool(path, max_idle=1)
+            conn = pool.connect()
+            members = conn.execute('SELECT COUNT(*) FROM group_members').fetchone()[0]
+            timings = []
+            for flow in (lambda conn: get_analytics(conn, 30), ad_hoc):
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    flow(conn)
+                timings.append((time.perf_counter() - start) / args.repeat * 1000)
+            conn.close()
+            pool.close_all()
+            print(f'{size:>8} groups {members:>8} memberships  rollups {timings[0]:>8.2f}  ad hoc {timings[1]:>8.2f}')
+
+
+def login(args):
+    # Password checks per second from many request threads, hashing inline
+    # (workers=0) and in process pools of increasing size. Each check is
+    # one key derivation with the app's PASSWORD_HASH_METHOD (pbkdf2:sha256
+    # at 600000 iterations); past the number of cores extra workers only
+    # add queueing
+    password_hash = PasswordHasher(PASSWORD_HASH_METHOD, workers=0).hash('password')
+    print(f'{os.cpu_count()} cores, {args.threads} threads, {args.seconds}s each')
+    for workers in [int(workers) for workers in args.workers.split(',')]:
+        hasher = PasswordHasher(workers=workers, max_pending=args.threads)
+        hasher.verify(password_hash, 'password')  # start the worker processes
+        latencies = []
+
+        def worker(stop, counter):
+            while not stop.is_set():
+                start = time.perf_counter()
+                if hasher.verify(password_hash, 'password')[0]:
+                    counter['ops'] += 1
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    counter['errors'] += 1
+
+        counters = run_threads([worker] * args.threads, args.seconds)
+        hasher.close()
+        latencies.sort()
+        logins = sum(counter['ops'] for counter in counters)
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+        print(f"{'inline' if workers == 0 else f'{workers} workers':<11} {logins / args.seconds:>8.1f} logins/s  p95 {p95:>8.1f} ms")
+
+
+
+def export(args):
+    # Peak Python memory and time for a full list of groups: built in
+    # memory and serialized at once (as /find-group?format=json does)
+    # against streamed by /admin/export/groups, plain and gzipped
+    def in_memory(conn):
+        return len(json.dumps([dict(row) for row in conn.execute(EXPORT_QUERIES['groups'])]))
+
+    def streamed(compress):
+        def run(conn):
+            return sum(len(chunk) for chunk in export_ndjson_chunks(conn, EXPORT_QUERIES['groups'], compress))
+        return run
+
+    flows = [('in memory', in_memory), ('streamed', streamed(False)), ('streamed gzip', streamed(True))]
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            path = os.path.join(tmp, f'export-{size}.db')
+            create_database(path, groups=size, memberships=False)
+            pool = ConnectionPool(path, max_idle=1)
+            for name, flow in flows:
+                conn = pool.connect()
+                tracemalloc.start()
+                start = time.perf_counter()
+                size_bytes = flow(conn)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                conn.close()
+                print(f'{size:>8} groups  {name:<14} peak {peak / 2 ** 20:>7.1f} MiB  {elapsed:>6.2f}s  {size_bytes / 2 ** 20:>7.1f} MiB sent')
+            pool.close_all()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Study group system benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    concurrency_parser = subparsers.add_parser(
+        'concurrency', help='Reader/writer throughput with and without WAL'
+    )
+    concurrency_parser.add_argument('--seconds', type=float, default=5)
+    concurrency_parser.add_argument('--readers', type=int, default=8)
+    concurrency_parser.add_argument('--writers', type=int, default=2)
+    concurrency_parser.set_defaults(func=concurrency)
+
+    plans_parser = subparsers.add_parser(
+        'query-plans', help='Fail if a hot query plans a SCAN step that is not allow-listed'
+    )
+    plans_parser.set_defaults(func=query_plans)
+
+    dates_parser = subparsers.add_parser(
+        'date-filter', help='find_group date filter on date(g.date) vs the indexed date_iso'
+    )
+    dates_parser.add_argument('--groups', type=int, default=200000)
+    dates_parser.add_argument('--repeat', type=int, default=20)
+    dates_parser.set_defaults(func=date_filter)
+
+    search_parser = subparsers.add_parser(
+        'search', help='find_group q= full-text search latency as the group count grows'
+    )
+    search_parser.add_argument('--sizes', default='10000,40000,160000')
+    search_parser.add_argument('--repeat', type=int, default=20)
+    search_parser.set_defaults(func=search)
+
+    stress_parser = subparsers.add_parser(
+        'join-stress', help='Concurrent joins/leaves from many processes never overfill a group'
+    )
+    stress_parser.add_argument('--processes', type=int, default=8)
+    stress_parser.add_argument('--seconds', type=float, default=5)
+    stress_parser.add_argument('--users', type=int, default=50)
+    stress_parser.add_argument('--groups', type=int, default=10)
+    stress_parser.add_argument('--capacity', type=int, default=5)
+    stress_parser.add_argument('--leave-ratio', type=float, default=0.3)
+    stress_parser.set_defaults(func=join_stress)
+
+    batching_parser = subparsers.add_parser(
+        'write-batching', help='Join throughput with one commit per join vs group commit'
+    )
+    batching_parser.add_argument('--threads', type=int, default=32)
+    batching_parser.add_argument('--seconds', type=float, default=5)
+    batching_parser.add_argument('--users', type=int, default=20000)
+    batching_parser.add_argument('--groups', type=int, default=2000)
+    batching_parser.add_argument('--interval', type=float, default=2, help='Batch window in milliseconds')
+    batching_parser.set_defaults(func=write_batching)
+
+    view_parser = subparsers.add_parser(
+        'view-group', help='/group/<id> database time: four queries vs one'
+    )
+    view_parser.add_argument('--members', default='10,100,1000')
+    view_parser.add_argument('--repeat', type=int, default=500)
+    view_parser.set_defaults(func=view_group)
+
+    analytics_parser = subparsers.add_parser(
+        'analytics', help='/admin/analytics from the rollups vs ad hoc aggregation'
+    )
+    analytics_parser.add_argument('--sizes', default='2000,20000,100000')
+    analytics_parser.add_argument('--repeat', type=int, default=20)
+    analytics_parser.set_defaults(func=analytics)
+
+    login_parser = subparsers.add_parser(
+        'login', help='Login password check throughput by hashing pool size'
+    )
+    login_parser.add_argument('--workers', default=','.join(str(n) for n in sorted({0, 1, 2, os.cpu_count() or 1})))
+    login_parser.add_argument('--threads', type=int, default=32)
+    login_parser.add_argument('--seconds', type=float, default=5)
+    login_parser.set_defaults(func=login)
+
+    export_parser = subparsers.add_parser(
+        'export', help='Memory use of /admin/export streaming vs building the list in memory'
+    )
+    export_parser.add_argument('--sizes', default='10000,100000')
+    export_parser.set_defaults(func=export)
+
+    args = parser.parse_args()
+    args.func(args)
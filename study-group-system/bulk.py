@@ -0,0 +1,342 @@
+"""
+Bulk import and export of users and study groups, e.g. to load a term's
+students and instructor-seeded groups from the registrar's files:
+
+    python bulk.py import-users students.csv [--workers 4] [--batch-size 2000]
+    python bulk.py import-groups groups.jsonl
+    python bulk.py export-users users.csv [--with-hashes]
+    python bulk.py export-groups groups.jsonl
+
+Files are CSV with a header row or JSON Lines, picked by extension (or
+--format); '-' reads stdin / writes stdout. Rows are streamed, so files
+of any size use constant memory.
+
+Users: student_id, name, email and either password (hashed here, in
+parallel) or password_hash; is_admin is optional. Every new user gets
+default user_preferences, as with /register. Groups: subject, created_by
+(the creator's student_id) and optionally name, description, goal, date,
+time, location and max_members; the creator becomes the first member, as
+with /create-group. Rows that are invalid or already exist are skipped
+and reported: users by student_id or email, groups by name, subject,
+creator, date and time, so that importing a file twice is harmless.
+JSON Lines that don't parse or aren't objects are skipped the same way.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from app import PASSWORD_HASH_METHOD, init_db
+from database import ConnectionPool
+from passwords import PasswordHasher
+
+USER_EXPORT_COLUMNS = ['student_id', 'name', 'email', 'is_admin', 'created_at']
+GROUP_EXPORT_COLUMNS = ['id', 'name', 'subject', 'description', 'goal', 'date', 'time', 'location',
+                        'max_members', 'current_members', 'created_by', 'created_at']
+
+# How many rows of a file are reported as skipped before just counting them
+MAX_REPORTED_ERRORS = 20
+
+
+def file_format(path, format=None):
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+class InvalidRow:
+    """A JSON Lines row that isn't a JSON object, and why"""
+    def __init__(self, reason):
+        self.reason = reason
+
+
+def read_rows(path, format=None):
+    """
+    Yield (line number, dict) for each row of a CSV or JSON Lines file, or
+    (line number, InvalidRow) for a JSON line that can't be a row
+    """
+    file = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        if file_format(path, format) == 'jsonl':
+            for line_number, line in enumerate(file, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError as error:
+                        row = InvalidRow(f'invalid JSON ({error.msg})')
+                    else:
+                        if not isinstance(row, dict):
+                            row = InvalidRow('not a JSON object')
+                    yield line_number, row
+        else:
+            # Header is line 1
+            for line_number, row in enumerate(csv.DictReader(file), start=2):
+                yield line_number, row
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def valid_rows(rows, report):
+    """Rows from read_rows, with the invalid ones counted and reported as skipped"""
+    for line_number, row in rows:
+        if isinstance(row, InvalidRow):
+            report.read += 1
+            report.skip(line_number, row.reason)
+        else:
+            yield line_number, row
+
+
+def batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def text(row, key):
+    value = row.get(key)
+    return str(value).strip() if value is not None else ''
+
+
+class ImportReport:
+    """Counts and timing of one import, with the first few skipped rows"""
+    def __init__(self, kind):
+        self.kind = kind
+        self.read = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.hash_seconds = 0.0
+        self.started = time.monotonic()
+
+    def skip(self, line_number, reason):
+        self.skipped += 1
+        if self.skipped <= MAX_REPORTED_ERRORS:
+            print(f'line {line_number}: skipped, {reason}', file=sys.stderr)
+
+    def summary(self):
+        seconds = time.monotonic() - self.started
+        return (f'{self.kind}: {self.inserted} imported, {self.skipped} skipped of {self.read} rows '
+                f'in {seconds:.2f}s ({self.read / seconds if seconds else 0:.0f} rows/s'
+                f'{f", {self.hash_seconds:.2f}s hashing" if self.hash_seconds else ""})')
+
+
+def import_users(conn, rows, hasher, batch_size=2000):
+    """
+    Insert users, hashing plain passwords batch by batch across the
+    hasher's workers, with one transaction and one executemany per batch
+    """
+    report = ImportReport('users')
+    for batch in batches(valid_rows(rows, report), batch_size):
+        report.read += len(batch)
+        users, plain = [], []
+        for line_number, row in batch:
+            student_id, name, email = text(row, 'student_id'), text(row, 'name'), text(row, 'email')
+            # Passwords are hashed as given, unstripped, as /register does
+            password = str(row['password']) if row.get('password') is not None else ''
+            password_hash = text(row, 'password_hash')
+            if not student_id or not name or not email:
+                report.skip(line_number, 'student_id, name and email are required')
+                continue
+            if not password and not password_hash:
+                report.skip(line_number, 'password or password_hash is required')
+                continue
+            is_admin = 1 if text(row, 'is_admin').lower() in ('1', 'true', 'yes') else 0
+            users.append([line_number, student_id, name, email, password_hash, is_admin])
+            if not password_hash:
+                plain.append((len(users) - 1, password))
+
+        started = time.monotonic()
+        for (index, _), password_hash in zip(plain, hasher.hash_many(password for _, password in plain)):
+            users[index][4] = password_hash
+        report.hash_seconds += time.monotonic() - started
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (student_id, name, email, password_hash, is_admin) VALUES (?, ?, ?, ?, ?)',
+                [user[1:] for user in users]
+            )
+            inserted = conn.total_changes - before
+            # Default preferences for the users just inserted, as /register does
+            conn.execute('''
+                INSERT INTO user_preferences (user_id, subjects, availability, learning_style, experience_level, preferred_goals, preferred_dates, preferred_group_size)
+                SELECT id, '', '', '', '', '', '', '' FROM users
+                WHERE student_id IN (SELECT value FROM json_each(?))
+                AND NOT EXISTS (SELECT 1 FROM user_preferences WHERE user_id = users.id)
+            ''', (json.dumps([user[1] for user in users]),))
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+        report.inserted += inserted
+        if inserted < len(users):
+            # Which ones already existed isn't reported per row by executemany
+            report.skipped += len(users) - inserted
+            print(f'{len(users) - inserted} users in rows {users[0][0]}-{users[-1][0]} skipped, '
+                  f'student_id or email already exists', file=sys.stderr)
+    return report
+
+
+def import_groups(conn, rows, batch_size=2000):
+    """
+    Insert study groups, each with its creator as the first member, with
+    one transaction and one executemany per batch. Groups with the same
+    name, subject, creator, date and time as an existing one (or an
+    earlier row) are skipped
+    """
+    report = ImportReport('groups')
+    for batch in batches(valid_rows(rows, report), batch_size):
+        report.read += len(batch)
+        creators = dict(conn.execute(
+            'SELECT student_id, id FROM users WHERE student_id IN (SELECT value FROM json_each(?))',
+            (json.dumps([text(row, 'created_by') for _, row in batch]),)
+        ).fetchall())
+
+        groups = []
+        for line_number, row in batch:
+            subject, creator = text(row, 'subject'), text(row, 'created_by')
+            if not subject:
+                report.skip(line_number, 'subject is required')
+                continue
+            if creator not in creators:
+                report.skip(line_number, f'no user with student_id {creator!r} (created_by)')
+                continue
+            try:
+                max_members = int(text(row, 'max_members') or 10)
+            except ValueError:
+                report.skip(line_number, 'max_members must be an integer')
+                continue
+            goal, date, time_, location = text(row, 'goal'), text(row, 'date'), text(row, 'time'), text(row, 'location')
+            # Same defaults as /create-group
+            name = text(row, 'name') or f'{subject} Study Group'
+            description = text(row, 'description') or \
+                f'Study session for {subject} on {date} at {time_} located at {location}. Goal: {goal}'
+            groups.append((line_number, (name, subject, creators[creator], date, time_),
+                           (name, subject, description, goal, date, date, time_, location, max_members, creators[creator])))
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Checked under the write lock, against earlier batches as well
+            existing = {tuple(row) for row in conn.execute(
+                "SELECT name, subject, created_by, COALESCE(date, ''), COALESCE(time, '') FROM study_groups "
+                'WHERE created_by IN (SELECT value FROM json_each(?))',
+                (json.dumps(sorted({key[2] for _, key, _ in groups})),)
+            )}
+            new_groups = []
+            for line_number, key, values in groups:
+                if key in existing:
+                    report.skip(line_number, 'a group with this name, subject, creator, date and time already exists')
+                    continue
+                existing.add(key)
+                new_groups.append(values)
+            # The write lock is held, so the new groups are exactly those after last_id
+            last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM study_groups').fetchone()[0]
+            conn.executemany(
+                'INSERT INTO study_groups (name, subject, description, goal, date, date_iso, time, location, max_members, current_members, created_by) VALUES (?, ?, ?, ?, ?, date(?), ?, ?, ?, 1, ?)',
+                new_groups
+            )
+            conn.execute(
+                'INSERT INTO group_members (user_id, group_id) SELECT created_by, id FROM study_groups WHERE id > ?',
+                (last_id,)
+            )
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+        report.inserted += len(new_groups)
+    return report
+
+
+def export_rows(conn, path, sql, columns, format=None, chunk_size=1000):
+    """Stream a query's rows to a CSV or JSON Lines file; returns the row count"""
+    file = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    jsonl = file_format(path, format) == 'jsonl'
+    count = 0
+    try:
+        if not jsonl:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                if jsonl:
+                    file.write(json.dumps(dict(zip(columns, row))) + '\n')
+                else:
+                    writer.writerow(row)
+            count += len(rows)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk user and study group import/export')
+    parser.add_argument('--db', default='study_groups.db', help='Path to the SQLite database')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (default: from the extension)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    users_parser = subparsers.add_parser('import-users', help='Import users from a CSV/JSONL file')
+    users_parser.add_argument('path')
+    users_parser.add_argument('--batch-size', type=int, default=2000, help='Rows per transaction')
+    users_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Password hashing processes')
+    users_parser.add_argument('--hash-method', default=PASSWORD_HASH_METHOD)
+
+    groups_parser = subparsers.add_parser('import-groups', help='Import study groups from a CSV/JSONL file')
+    groups_parser.add_argument('path')
+    groups_parser.add_argument('--batch-size', type=int, default=2000, help='Rows per transaction')
+
+    export_users_parser = subparsers.add_parser('export-users', help='Export users to a CSV/JSONL file')
+    export_users_parser.add_argument('path')
+    export_users_parser.add_argument('--with-hashes', action='store_true',
+                                     help='Include password hashes, so the file can be imported elsewhere')
+
+    export_groups_parser = subparsers.add_parser('export-groups', help='Export study groups to a CSV/JSONL file')
+    export_groups_parser.add_argument('path')
+
+    args = parser.parse_args()
+
+    pool = ConnectionPool(args.db, max_idle=1)
+    init_db(pool.connect())  # Create or upgrade the schema
+    conn = pool.connect()
+    started = time.monotonic()
+    # Progress and reports go to stderr, so exports can be written to stdout
+    try:
+        if args.command == 'import-users':
+            hasher = PasswordHasher(args.hash_method, workers=args.workers)
+            try:
+                report = import_users(conn, read_rows(args.path, args.format), hasher, args.batch_size)
+            finally:
+                hasher.close()
+            print(report.summary(), file=sys.stderr)
+        elif args.command == 'import-groups':
+            report = import_groups(conn, read_rows(args.path, args.format), args.batch_size)
+            print(report.summary(), file=sys.stderr)
+        else:
+            if args.command == 'export-users':
+                columns = USER_EXPORT_COLUMNS + (['password_hash'] if args.with_hashes else [])
+                sql = f'SELECT {", ".join(columns)} FROM users ORDER BY id'
+            else:
+                # created_by as the creator's student_id, as import-groups expects
+                columns = GROUP_EXPORT_COLUMNS
+                select = ', '.join('u.student_id' if column == 'created_by' else f'g.{column}' for column in columns)
+                sql = f'SELECT {select} FROM study_groups g LEFT JOIN users u ON u.id = g.created_by ORDER BY g.id'
+            count = export_rows(conn, args.path, sql, columns, args.format)
+            seconds = time.monotonic() - started
+            print(f'{args.command}: {count} rows in {seconds:.2f}s ({count / seconds if seconds else 0:.0f} rows/s)',
+                  file=sys.stderr)
+    finally:
+        conn.close()
+        pool.close_all()
@@ -0,0 +1,120 @@
+"""
+Consistency check for study_groups.current_members, the denormalized member
+count that /find-group, join capacity checks and the matching engine's open
+group filter read instead of counting group_members per request:
+
+    python consistency.py member-counts [--repair] [--interval 3600]
+"""
+import argparse
+import time
+
+from database import ConnectionPool
+
+# Groups whose stored count differs from their member rows, from one
+# aggregate pass over group_members (covered by idx_group_members_group)
+DRIFT_QUERY = '''
+    SELECT g.id, g.max_members, g.current_members, COUNT(gm.user_id) AS actual_members
+    FROM study_groups g
+    LEFT JOIN group_members gm ON gm.group_id = g.id
+    GROUP BY g.id
+    HAVING g.current_members IS NOT COUNT(gm.user_id)
+'''
+
+# Recounted inside the write transaction, so a join or leave committed
+# between the check and the repair is never overwritten by a stale count
+REPAIR_QUERY = '''
+    UPDATE study_groups
+    SET current_members = (SELECT COUNT(*) FROM group_members WHERE group_id = study_groups.id)
+    WHERE id IN ({placeholders})
+    AND current_members IS NOT (SELECT COUNT(*) FROM group_members WHERE group_id = study_groups.id)
+'''
+
+
+def find_member_count_drift(conn):
+    """
+    Groups whose current_members is wrong, as a list of dicts with the
+    stored and actual counts, plus the number of memberships that point at
+    a group that no longer exists
+    """
+    drift = [dict(row) for row in conn.execute(DRIFT_QUERY)]
+    orphaned = conn.execute('''
+        SELECT COUNT(*) FROM group_members
+        WHERE NOT EXISTS (SELECT 1 FROM study_groups WHERE id = group_members.group_id)
+    ''').fetchone()[0]
+    return drift, orphaned
+
+
+def repair_member_counts(conn, group_ids, batch_size=200, pause=0.01):
+    """
+    Recount current_members for group_ids, batch_size groups per short write
+    transaction with a pause between batches so that request writers are
+    never held up for long. Returns the number of rows changed
+    """
+    repaired = 0
+    for start in range(0, len(group_ids), batch_size):
+        batch = group_ids[start:start + batch_size]
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            repaired += conn.execute(
+                REPAIR_QUERY.format(placeholders=', '.join('?' * len(batch))), batch
+            ).rowcount
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+        if pause and start + batch_size < len(group_ids):
+            time.sleep(pause)
+    return repaired
+
+
+def check_member_counts(conn, repair=False, batch_size=200, verbose=True):
+    """Report member count drift and optionally repair it; returns a summary dict"""
+    started = time.monotonic()
+    drift, orphaned = find_member_count_drift(conn)
+    summary = {
+        'drifted_groups': len(drift),
+        'total_drift': sum(abs((group['current_members'] or 0) - group['actual_members']) for group in drift),
+        'over_capacity': sum(group['actual_members'] > group['max_members'] for group in drift),
+        'orphaned_memberships': orphaned,
+        'repaired': repair_member_counts(conn, [group['id'] for group in drift], batch_size) if repair else 0,
+        'seconds': time.monotonic() - started
+    }
+
+    if verbose:
+        for group in drift[:20]:
+            print(f"group {group['id']}: current_members {group['current_members']}, "
+                  f"{group['actual_members']} members (max {group['max_members']})")
+        if len(drift) > 20:
+            print(f'... and {len(drift) - 20} more')
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Study group data consistency jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    counts_parser = subparsers.add_parser(
+        'member-counts', help='Check study_groups.current_members against group_members'
+    )
+    counts_parser.add_argument('--db', default='study_groups.db', help='Path to the SQLite database')
+    counts_parser.add_argument('--repair', action='store_true', help='Fix the counts that drifted')
+    counts_parser.add_argument('--batch-size', type=int, default=200, help='Groups repaired per transaction')
+    counts_parser.add_argument('--interval', type=float, default=0,
+                               help='Keep running, checking every INTERVAL seconds')
+
+    args = parser.parse_args()
+
+    if args.command == 'member-counts':
+        pool = ConnectionPool(args.db, max_idle=1)
+        while True:
+            conn = pool.connect()
+            try:
+                summary = check_member_counts(conn, repair=args.repair, batch_size=args.batch_size)
+            finally:
+                conn.close()
+            print(f"{summary['drifted_groups']} groups drifted (total {summary['total_drift']}, "
+                  f"{summary['over_capacity']} over capacity), {summary['orphaned_memberships']} orphaned memberships, "
+                  f"{summary['repaired']} repaired in {summary['seconds']:.2f}s")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
@@ -0,0 +1,264 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Pragmas applied once to every new connection. In WAL mode (see init_db in
+# app.py) synchronous=NORMAL never corrupts the database, but the last
+# commits before a power loss can be lost; WriteBatcher uses FULL
+DEFAULT_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,  # Negative means KiB: a 16 MB page cache
+    'mmap_size': 268435456,  # 256 MB of the database memory-mapped
+    'busy_timeout': 5000,  # Wait up to 5s for a lock instead of failing
+    'temp_store': 'MEMORY',
+}
+
+class PooledConnection(sqlite3.Connection):
+    """
+    sqlite3 connection that goes back to its pool on close() instead of
+    being closed, so callers keep the usual connect/close pattern
+    """
+    pool = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.checked_out = False
+            self.pool.release(self)
+
+    def close_connection(self):
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Pool of reusable SQLite connections shared by app.py and the matching
+    engine, so that a request no longer pays for sqlite3.connect() (and the
+    pragma setup) on every query
+    """
+    def __init__(self, db_path, max_idle=8, pragmas=None):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def open_connection(self):
+        # Connections move between request threads, but only one thread
+        # uses a connection at a time
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def connect(self):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.opened += 1
+            else:
+                self.reused += 1
+
+        if conn is None:
+            conn = self.open_connection()
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        # Whatever the caller did not commit is discarded, as a real close would
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close_connection()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close_connection()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'idle': len(self.idle),
+                'max_idle': self.max_idle,
+                'opened': self.opened,
+                'reused': self.reused
+            }
+
+
+class WriteBatcher:
+    """
+    Group commit for short write transactions. submit(fn) queues fn(conn)
+    and blocks until the transaction that ran it has committed. A single
+    writer thread runs everything queued within `interval` seconds of the
+    first waiting write (or up to max_batch writes) in one transaction, so
+    N concurrent joins cost one commit instead of N.
+
+    Each write runs inside its own savepoint: if it raises, only its changes
+    are rolled back and the exception is re-raised to its caller. submit()
+    returns only after COMMIT on the batcher's own connection, which uses
+    synchronous=FULL: the WAL is synced on every commit, so an acknowledged
+    write survives a power loss, and the sync is paid once per batch. If
+    the commit fails every write in the batch gets the error
+    """
+    def __init__(self, pool, interval=0.002, max_batch=256):
+        self.pool = pool
+        self.interval = interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.conn = None  # Opened by the writer thread
+        self.thread = None
+        self.lock = threading.Lock()
+        self.commits = 0
+        self.writes = 0
+        self.failed_commits = 0
+        self.cancelled = 0
+        self.largest_batch = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='write-batcher', daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        """Finish the queued writes and stop the writer thread"""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def submit(self, fn, timeout=30, commit_timeout=60):
+        """
+        Run fn(conn) in the next batch and return its result once committed.
+        If the write hasn't started within timeout seconds it is cancelled,
+        will never run, and TimeoutError is raised. Once its batch has
+        started, the caller waits up to commit_timeout more seconds for the
+        commit; TimeoutError after that means the outcome is unknown
+        """
+        self.start()  # Restarts the writer thread if it died
+        future = Future()
+        self.queue.put((fn, future))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            return future.result(commit_timeout)
+
+    def next_batch(self):
+        # Block for the first write, then gather more until the interval is up
+        first = self.queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.queue.put(None)  # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+            self.commit_batch(batch)
+
+    def connection(self):
+        """The writer thread's connection: not pooled, and synchronous=FULL"""
+        if self.conn is None:
+            conn = self.pool.open_connection()
+            conn.pool = None  # close() really closes it
+            try:
+                conn.execute('PRAGMA synchronous = FULL')
+            except Exception:
+                conn.close()
+                raise
+            self.conn = conn
+        return self.conn
+
+    def commit_batch(self, batch):
+        # Writes whose submit() gave up are dropped; the rest can no longer be cancelled
+        started = [(fn, future) for fn, future in batch if future.set_running_or_notify_cancel()]
+        with self.lock:
+            self.cancelled += len(batch) - len(started)
+        batch = started
+        if not batch:
+            return
+        results = []
+        conn = None
+        try:
+            conn = self.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            for fn, future in batch:
+                conn.execute('SAVEPOINT batched_write')
+                try:
+                    results.append((future, fn(conn), None))
+                    conn.execute('RELEASE batched_write')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO batched_write')
+                    conn.execute('RELEASE batched_write')
+                    results.append((future, None, e))
+            conn.commit()
+        except Exception as e:
+            # Start over with a fresh connection in case this one is broken
+            if conn is not None:
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                finally:
+                    conn.close()
+            self.conn = None
+            with self.lock:
+                self.failed_commits += 1
+            for fn, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.lock:
+            self.commits += 1
+            self.writes += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        # Acknowledge only now that the batch is committed
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'commits': self.commits,
+                'writes': self.writes,
+                'failed_commits': self.failed_commits,
+                'cancelled': self.cancelled,
+                'largest_batch': self.largest_batch,
+                'queued': self.queue.qsize()
+            }
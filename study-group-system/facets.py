@@ -0,0 +1,103 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class FacetCache:
+    """
+    Subjects and goals of the study groups with their group and open-group
+    counts, as served by /api/facets.
+
+    Loaded with one query, then kept current by the routes after each
+    committed group or membership change, the same way as the matching
+    engine's membership index. The updates are idempotent (they carry the
+    group's new state rather than a delta), so one that races a reload is
+    harmless. After ttl seconds the next request reloads, which bounds how
+    long a change made outside the app can go unnoticed
+    """
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.groups = {}  # group id -> (subject, goal, is_open)
+        self.subjects = {}  # subject -> [groups, open groups]
+        self.goals = {}  # goal -> [groups, open groups]
+        self.loaded_at = None
+        self.response = None  # (body, etag), rebuilt on the next request after a change
+        self.lock = threading.Lock()
+
+    def is_fresh(self):
+        return self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    def load(self, conn):
+        rows = conn.execute(
+            'SELECT id, subject, goal, current_members, max_members FROM study_groups'
+        ).fetchall()
+        with self.lock:
+            self.groups, self.subjects, self.goals = {}, {}, {}
+            for row in rows:
+                self._set(row['id'], row['subject'], row['goal'], row['current_members'] < row['max_members'])
+            self.loaded_at = time.monotonic()
+            self.response = None
+
+    def _count(self, group, sign):
+        subject, goal, is_open = group
+        for facets, value in ((self.subjects, subject), (self.goals, goal)):
+            if not value:
+                continue
+            counts = facets.setdefault(value, [0, 0])
+            counts[0] += sign
+            counts[1] += sign * is_open
+            if counts[0] == 0:
+                del facets[value]
+
+    def _set(self, group_id, subject, goal, is_open):
+        old = self.groups.get(group_id)
+        new = (subject, goal, bool(is_open))
+        if old == new:
+            return
+        if old is not None:
+            self._count(old, -1)
+        self.groups[group_id] = new
+        self._count(new, 1)
+        self.response = None
+
+    # Updates from the routes; ignored until the first load
+
+    def group_added(self, group_id, subject, goal, current_members, max_members):
+        with self.lock:
+            if self.loaded_at is not None:
+                self._set(group_id, subject, goal, current_members < max_members)
+
+    def group_updated(self, group_id, current_members, max_members):
+        with self.lock:
+            group = self.groups.get(group_id)
+            if group is not None:
+                self._set(group_id, group[0], group[1], current_members < max_members)
+
+    def group_removed(self, group_id):
+        with self.lock:
+            group = self.groups.pop(group_id, None)
+            if group is not None:
+                self._count(group, -1)
+                self.response = None
+
+    # Reads
+
+    def facets(self, name):
+        """Sorted [(value, groups, open groups)] for 'subjects' or 'goals'"""
+        with self.lock:
+            facets = self.subjects if name == 'subjects' else self.goals
+            return sorted((value, counts[0], counts[1]) for value, counts in facets.items())
+
+    def get_response(self):
+        """JSON body and ETag for /api/facets, built once per change"""
+        with self.lock:
+            if self.response is None:
+                body = json.dumps({
+                    'subjects': [{'subject': value, 'groups': counts[0], 'open_groups': counts[1]}
+                                 for value, counts in sorted(self.subjects.items())],
+                    'goals': [{'goal': value, 'groups': counts[0], 'open_groups': counts[1]}
+                              for value, counts in sorted(self.goals.items())]
+                })
+                self.response = (body, hashlib.sha1(body.encode()).hexdigest())
+            return self.response
@@ -1,16 +1,768 @@
+import argparse
+import json
 import sqlite3
 from datetime import datetime, timedelta
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+import heapq
 import math
+import random
+import threading
+import time
+
+from database import ConnectionPool
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only needed for vectorized scoring
+    np = None
+
+# Precomputed recommendations, written by the refresh job (see __main__).
+# recommendation_events logs every change that can alter recommendations, so
+# the job only recomputes users whose neighbourhood changed and /auto-match
+# can tell whether a user's precomputed list is still fresh. Events are only
+# logged once a first refresh has run
+RECOMMENDATION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS user_recommendations (
+        user_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        group_id INTEGER NOT NULL,
+        rules_score REAL,
+        cf_score REAL,
+        final_score REAL,
+        PRIMARY KEY (user_id, rank)
+    );
+
+    CREATE TABLE IF NOT EXISTS user_recommendation_state (
+        user_id INTEGER PRIMARY KEY,
+        generation INTEGER NOT NULL  -- Refresh run that last computed this user
+    );
+
+    CREATE TABLE IF NOT EXISTS recommendation_runs (
+        generation INTEGER PRIMARY KEY AUTOINCREMENT,
+        last_event_id INTEGER,  -- Events up to this id are reflected once finished
+        full_refresh INTEGER DEFAULT 0,
+        users_updated INTEGER DEFAULT 0,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS recommendation_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,  -- NULL when a whole group changed (created, deleted, filled up...)
+        group_id INTEGER
+    );
+
+    CREATE TRIGGER IF NOT EXISTS recommendation_events_member_added
+    AFTER INSERT ON group_members
+    WHEN EXISTS (SELECT 1 FROM recommendation_runs)
+    BEGIN
+        INSERT INTO recommendation_events (user_id, group_id) VALUES (NEW.user_id, NEW.group_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS recommendation_events_member_removed
+    AFTER DELETE ON group_members
+    WHEN EXISTS (SELECT 1 FROM recommendation_runs)
+    BEGIN
+        INSERT INTO recommendation_events (user_id, group_id) VALUES (OLD.user_id, OLD.group_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS recommendation_events_group_added
+    AFTER INSERT ON study_groups
+    WHEN EXISTS (SELECT 1 FROM recommendation_runs)
+    BEGIN
+        INSERT INTO recommendation_events (user_id, group_id) VALUES (NULL, NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS recommendation_events_group_removed
+    AFTER DELETE ON study_groups
+    WHEN EXISTS (SELECT 1 FROM recommendation_runs)
+    BEGIN
+        INSERT INTO recommendation_events (user_id, group_id) VALUES (NULL, OLD.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS recommendation_events_group_changed
+    AFTER UPDATE OF subject, max_members, current_members ON study_groups
+    WHEN EXISTS (SELECT 1 FROM recommendation_runs)
+    AND (OLD.subject IS NOT NEW.subject
+         OR OLD.max_members IS NOT NEW.max_members
+         OR (OLD.current_members < OLD.max_members) IS NOT (NEW.current_members < NEW.max_members))
+    BEGIN
+        INSERT INTO recommendation_events (user_id, group_id) VALUES (NULL, NEW.id);
+    END;
+'''
+
+# Every write that changes what MembershipIndex holds logs the group it
+# touched, whichever process made it (app workers, bulk.py, consistency.py
+# repairs...), so each process can bring its own index up to date by
+# reloading just those groups
+MEMBERSHIP_CHANGES_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS membership_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        group_id INTEGER NOT NULL
+    );
+
+    CREATE TRIGGER IF NOT EXISTS membership_changes_member_added
+    AFTER INSERT ON group_members
+    BEGIN
+        INSERT INTO membership_changes (group_id) VALUES (NEW.group_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS membership_changes_member_removed
+    AFTER DELETE ON group_members
+    BEGIN
+        INSERT INTO membership_changes (group_id) VALUES (OLD.group_id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS membership_changes_group_added
+    AFTER INSERT ON study_groups
+    BEGIN
+        INSERT INTO membership_changes (group_id) VALUES (NEW.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS membership_changes_group_removed
+    AFTER DELETE ON study_groups
+    BEGIN
+        INSERT INTO membership_changes (group_id) VALUES (OLD.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS membership_changes_group_changed
+    AFTER UPDATE OF subject, max_members ON study_groups
+    WHEN OLD.subject IS NOT NEW.subject OR OLD.max_members IS NOT NEW.max_members
+    BEGIN
+        INSERT INTO membership_changes (group_id) VALUES (NEW.id);
+    END;
+'''
+
+# Queries run per request, also checked by `python benchmarks.py query-plans`
+
+# Open groups, the candidates of get_recommendations
+RECOMMENDATION_CANDIDATES_QUERY = '''
+    SELECT sg.*
+    FROM study_groups sg
+    WHERE sg.current_members < sg.max_members
+    ORDER BY sg.id
+'''
+GROUPS_BY_ID_QUERY = 'SELECT * FROM study_groups WHERE id IN (SELECT value FROM json_each(?))'
+
+# get_precomputed_recommendations
+LAST_REFRESH_QUERY = 'SELECT last_event_id FROM recommendation_runs WHERE finished_at IS NOT NULL ORDER BY generation DESC LIMIT 1'
+RECOMMENDATION_STATE_QUERY = 'SELECT generation FROM user_recommendation_state WHERE user_id = ?'
+# Changes to the user's own memberships or to the groups they belong to
+RECOMMENDATION_STALENESS_QUERY = '''
+    SELECT 1 FROM recommendation_events
+    WHERE id > ?
+    AND (user_id = ?
+         OR (user_id IS NULL AND group_id IN (SELECT value FROM json_each(?))))
+    LIMIT 1
+'''
+CHANGED_GROUPS_QUERY = 'SELECT DISTINCT group_id FROM recommendation_events WHERE id > ? AND user_id IS NULL'
+# Stored recommendations still open, except the groups scored live instead
+PRECOMPUTED_RECOMMENDATIONS_QUERY = '''
+    SELECT sg.*, ur.rules_score AS rec_rules_score, ur.cf_score AS rec_cf_score,
+           ur.final_score AS rec_final_score
+    FROM user_recommendations ur
+    JOIN study_groups sg ON sg.id = ur.group_id
+    WHERE ur.user_id = ?
+    AND sg.current_members < sg.max_members
+    AND ur.group_id NOT IN (SELECT value FROM json_each(?))
+    ORDER BY ur.rank
+    LIMIT ?
+'''
+
+# Highest final score a user can give a group with no subject match and no
+# co-member in it: the group size bonus (0.10) at the 50% rules weight
+SIZE_ONLY_SCORE = 0.5 * 0.10
+
+# Users with a stored row for one of the groups, with fewer stored rows than
+# the refresh keeps, with a row a size-only match could beat, or with none
+AFFECTED_STORED_USERS_QUERY = '''
+    SELECT user_id FROM user_recommendations WHERE group_id IN (SELECT value FROM json_each(?))
+    UNION
+    SELECT user_id FROM user_recommendations GROUP BY user_id HAVING COUNT(*) < ? OR MIN(final_score) <= ?
+    UNION
+    SELECT user_id FROM user_recommendation_state
+    WHERE user_id NOT IN (SELECT user_id FROM user_recommendations)
+'''
+
+# MembershipIndex.sync
+MEMBERSHIP_CHANGES_QUERY = 'SELECT DISTINCT group_id FROM membership_changes WHERE id > ? AND id <= ?'
+SYNC_GROUPS_QUERY = 'SELECT id, subject, max_members FROM study_groups WHERE id IN (SELECT value FROM json_each(?))'
+SYNC_MEMBERS_QUERY = 'SELECT user_id, group_id FROM group_members WHERE group_id IN (SELECT value FROM json_each(?))'
+
+class MembershipIndex:
+    """
+    Resident sparse user x group membership matrix.
+
+    Loaded from group_members and then kept current by applying the
+    insert/delete events reported by app.py, so that collaborative filtering
+    and user profiles never have to query SQLite.
+
+    Writes made elsewhere are caught up from membership_changes: at most
+    every check_interval seconds, sync() compares the newest change id
+    with the last one applied and reloads only the groups changed since.
+    A full reload is due every reload_interval seconds regardless; it is
+    built aside and swapped in, so readers are not held up by it.
+    """
+    def __init__(self, check_interval=1.0, reload_interval=600, max_sync_groups=1000):
+        self.user_groups = defaultdict(set)  # user_id -> {group_id}
+        self.group_users = defaultdict(set)  # group_id -> {user_id}
+        self.groups = {}  # group_id -> (subject, max_members)
+        self.loaded = False
+        self.lock = threading.Lock()
+        self.check_interval = check_interval
+        self.reload_interval = reload_interval
+        self.max_sync_groups = max_sync_groups  # More changed groups than this: reload everything
+        self.last_change_id = None  # None when membership_changes doesn't exist
+        self.pruned_change_id = 0  # Change ids up to this may be deleted
+        self.loaded_at = 0.0
+        self.checked_at = 0.0
+        self.full_loads = 0
+        self.syncs = 0
+        self.synced_groups = 0
+
+    def _change_ids(self, conn):
+        """
+        (oldest, newest) id in membership_changes, or None when the table
+        doesn't exist. Once pruned empty, newest is the last id handed out
+        """
+        try:
+            row = conn.execute('''
+                SELECT (SELECT MIN(id) FROM membership_changes),
+                       COALESCE((SELECT MAX(id) FROM membership_changes),
+                                (SELECT seq FROM sqlite_sequence WHERE name = 'membership_changes'), 0)
+            ''').fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] or row[1] + 1, row[1]
+
+    def load(self, conn):
+        """
+        (Re)build the index from the database. The new index is read without
+        holding the lock, so that readers keep using the current one, then
+        swapped in and caught up with the changes logged meanwhile. Returns
+        the users whose groups differ from before, or None on the first load
+        """
+        user_groups = defaultdict(set)
+        group_users = defaultdict(set)
+        groups = {}
+
+        # Read before the data, so that changes committed meanwhile are
+        # applied again by the sync after the swap
+        change_ids = self._change_ids(conn)
+
+        for row in conn.execute('SELECT id, subject, max_members FROM study_groups'):
+            groups[row['id']] = (row['subject'], row['max_members'])
+
+        for row in conn.execute('SELECT user_id, group_id FROM group_members'):
+            user_groups[row['user_id']].add(row['group_id'])
+            group_users[row['group_id']].add(row['user_id'])
+
+        users = None
+        if self.loaded:
+            # Compared outside the lock: a change applied to the current index
+            # meanwhile was logged too, and is replayed by the sync below
+            with self.lock:
+                current = dict(self.user_groups)
+            users = {
+                user_id for user_id in current.keys() | user_groups.keys()
+                if current.get(user_id) != user_groups.get(user_id)
+            }
+
+        with self.lock:
+            self.user_groups = user_groups
+            self.group_users = group_users
+            self.groups = groups
+            self.loaded = True
+            self.loaded_at = self.checked_at = time.monotonic()
+            self.full_loads += 1
+
+            # Another process's index may still need the changes logged since
+            # its own last full load, which happened at most reload_interval
+            # ago: only those older than our previous full load are deleted
+            prune_up_to = self.pruned_change_id
+            self.last_change_id = change_ids[1] if change_ids else None
+            self.pruned_change_id = self.last_change_id or 0
+
+            if self.last_change_id is not None:
+                synced = self._sync(conn, max_groups=None)
+                if users is not None and synced:
+                    users.update(synced)
+
+        if prune_up_to:
+            try:
+                conn.execute('DELETE FROM membership_changes WHERE id <= ?', (prune_up_to,))
+                conn.commit()
+            except sqlite3.OperationalError:
+                conn.rollback()  # Busy: prune on the next load
+        return users
+
+    def reload_due(self):
+        return time.monotonic() - self.loaded_at >= self.reload_interval
+
+    def check_due(self):
+        """
+        True at most once every check_interval seconds, so that only one
+        thread runs the freshness check
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.last_change_id is None or now - self.checked_at < self.check_interval:
+                return False
+            self.checked_at = now
+            return True
+
+    def sync(self, conn):
+        """
+        Apply the changes logged in membership_changes since the last load
+        or sync by reloading the groups they touched. Returns the users whose
+        groups changed, or None when a full load() is needed instead (changes
+        already pruned, or too many of them)
+        """
+        with self.lock:
+            return self._sync(conn, self.max_sync_groups)
+
+    def _sync(self, conn, max_groups):
+        change_ids = self._change_ids(conn)
+        if change_ids is None:
+            return None
+        oldest, newest = change_ids
+        if newest <= self.last_change_id:
+            return set()
+        if oldest > self.last_change_id + 1:
+            return None
+
+        group_ids = [row[0] for row in conn.execute(MEMBERSHIP_CHANGES_QUERY, (self.last_change_id, newest))]
+        if max_groups is not None and len(group_ids) > max_groups:
+            return None
+
+        group_ids_json = json.dumps(group_ids)
+        groups = {
+            row['id']: (row['subject'], row['max_members'])
+            for row in conn.execute(SYNC_GROUPS_QUERY, (group_ids_json,))
+        }
+        group_users = defaultdict(set)
+        for row in conn.execute(SYNC_MEMBERS_QUERY, (group_ids_json,)):
+            group_users[row['group_id']].add(row['user_id'])
+
+        users = set()
+        for group_id in group_ids:
+            old_members = self.group_users.pop(group_id, set())
+            for user_id in old_members:
+                self._discard(self.user_groups, user_id, group_id)
+            self.groups.pop(group_id, None)
+
+            if group_id in groups:
+                self.groups[group_id] = groups[group_id]
+            new_members = group_users.get(group_id)
+            if new_members:
+                self.group_users[group_id] = new_members
+                for user_id in new_members:
+                    self.user_groups[user_id].add(group_id)
+                users.update(new_members)
+            users.update(old_members)
+
+        self.last_change_id = newest
+        self.syncs += 1
+        self.synced_groups += len(group_ids)
+        return users
+
+    # Events are ignored until the index is loaded: the load will read the
+    # already committed change from the database anyway
+
+    def add_group(self, group_id, subject, max_members):
+        with self.lock:
+            if self.loaded:
+                self.groups[group_id] = (subject, max_members)
+
+    def remove_group(self, group_id):
+        """
+        Remove a group and its memberships, returning the former members
+        """
+        with self.lock:
+            if not self.loaded:
+                return set()
+            self.groups.pop(group_id, None)
+            members = self.group_users.pop(group_id, set())
+            for user_id in members:
+                self._discard(self.user_groups, user_id, group_id)
+            return members
+
+    def add_member(self, user_id, group_id):
+        with self.lock:
+            if self.loaded:
+                self.user_groups[user_id].add(group_id)
+                self.group_users[group_id].add(user_id)
+
+    def remove_member(self, user_id, group_id):
+        with self.lock:
+            if self.loaded:
+                self._discard(self.user_groups, user_id, group_id)
+                self._discard(self.group_users, group_id, user_id)
+
+    def remove_user(self, user_id):
+        with self.lock:
+            if not self.loaded:
+                return
+            for group_id in self.user_groups.pop(user_id, ()):
+                self._discard(self.group_users, group_id, user_id)
+
+    def _discard(self, mapping, key, value):
+        members = mapping.get(key)
+        if members is not None:
+            members.discard(value)
+            if not members:
+                del mapping[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'users': len(self.user_groups),
+                'groups': len(self.groups),
+                'last_change_id': self.last_change_id,
+                'full_loads': self.full_loads,
+                'syncs': self.syncs,
+                'synced_groups': self.synced_groups,
+                'loaded_seconds_ago': time.monotonic() - self.loaded_at if self.loaded else None
+            }
+
+    def member_of(self, user_id):
+        """
+        Return the set of group ids the user belongs to
+        """
+        with self.lock:
+            return set(self.user_groups.get(user_id, ()))
+
+    def groups_of(self, user_id):
+        """
+        Return (subject, max_members) for each existing group the user
+        belongs to, in group id order
+        """
+        with self.lock:
+            return [
+                self.groups[group_id]
+                for group_id in sorted(self.user_groups.get(user_id, ()))
+                if group_id in self.groups
+            ]
+
+    def co_members(self, user_id):
+        """
+        Return the set of users sharing at least one group with the user
+        """
+        with self.lock:
+            similar_users = set()
+            for group_id in self.user_groups.get(user_id, ()):
+                similar_users.update(self.group_users.get(group_id, ()))
+            similar_users.discard(user_id)
+            return similar_users
+
+    def members(self, group_id):
+        with self.lock:
+            return set(self.group_users.get(group_id, ()))
+
+    def co_member_counts(self, user_id):
+        """
+        Return (number of similar users, {group_id: common_users}) where
+        similar users are everyone sharing at least one group with the user
+        and common_users counts how many of them belong to each existing
+        group the user has not joined
+        """
+        with self.lock:
+            own_groups = self.user_groups.get(user_id, set())
+
+            similar_users = set()
+            for group_id in own_groups:
+                similar_users.update(self.group_users.get(group_id, ()))
+            similar_users.discard(user_id)
+
+            counts = defaultdict(int)
+            for other_id in similar_users:
+                for group_id in self.user_groups.get(other_id, ()):
+                    if group_id not in own_groups and group_id in self.groups:
+                        counts[group_id] += 1
+
+        return len(similar_users), counts
+
+
+class MinHashLSH:
+    """
+    MinHash signatures with LSH banding over each user's set of groups.
+
+    Users whose signatures agree on every row of at least one band land in
+    the same bucket, so the users most similar by Jaccard can be found by
+    looking at a few buckets instead of comparing against everyone.
+    A pair with similarity s becomes a candidate with probability
+    1 - (1 - s**rows)**bands; the defaults (2 rows x 64 bands) suit the low
+    similarities typical of group memberships.
+    """
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=128, bands=64, seed=1):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+
+        rng = random.Random(seed)
+        self.hash_params = [
+            (rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME))
+            for _ in range(num_perm)
+        ]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.signatures = {}  # user_id -> band keys
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+        self.lock = threading.Lock()
+
+    def band_keys(self, group_ids):
+        signature = [
+            min((a * group_id + b) % self.PRIME for group_id in group_ids)
+            for a, b in self.hash_params
+        ]
+        return [
+            tuple(signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+
+    def update(self, user_id, group_ids):
+        """
+        (Re)index a user from their current set of groups
+        """
+        band_keys = self.band_keys(group_ids) if group_ids else None
+        with self.lock:
+            self._remove(user_id)
+            if band_keys:
+                self.signatures[user_id] = band_keys
+                for bucket, key in zip(self.buckets, band_keys):
+                    bucket[key].add(user_id)
+
+    def remove(self, user_id):
+        with self.lock:
+            self._remove(user_id)
+
+    def _remove(self, user_id):
+        band_keys = self.signatures.pop(user_id, None)
+        if band_keys:
+            for bucket, key in zip(self.buckets, band_keys):
+                users = bucket[key]
+                users.discard(user_id)
+                if not users:
+                    del bucket[key]
+
+    def candidates(self, user_id):
+        """
+        Return the users sharing at least one LSH bucket with the user
+        """
+        with self.lock:
+            band_keys = self.signatures.get(user_id)
+            if not band_keys:
+                return set()
+            users = set()
+            for bucket, key in zip(self.buckets, band_keys):
+                users.update(bucket.get(key, ()))
+            users.discard(user_id)
+            return users
+
+
+class ProfileCache:
+    """
+    LRU cache of computed user profiles with a TTL, keyed by user_id.
+    Entries are invalidated by the membership events of that user
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # user_id -> (expires_at, profile)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every invalidation so that a profile computed before an
+        # invalidation is not stored afterwards
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[user_id]  # Expired
+            self.misses += 1
+            return None
+
+    def put(self, user_id, profile, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[user_id] = (time.monotonic() + self.ttl, profile)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
 
 class MatchingEngine:
-    def __init__(self, db_path='study_groups.db'):
+    def __init__(self, db_path='study_groups.db', index=None, vectorized=False,
+                 profile_cache_size=1024, profile_cache_ttl=300, cf_neighbours=None,
+                 lsh_num_perm=128, lsh_bands=64, pool=None):
+        if vectorized and np is None:
+            raise ImportError('numpy is required for vectorized scoring')
+
         self.db_path = db_path
+        self.pool = pool if pool is not None else ConnectionPool(db_path)
+        self.index = index if index is not None else MembershipIndex()
+        self.vectorized = vectorized  # Score candidates with NumPy instead of a Python loop
+        self.profile_cache = ProfileCache(profile_cache_size, profile_cache_ttl)
+        # When set, CF scores are weighted by the Jaccard similarity of the
+        # top `cf_neighbours` LSH neighbours instead of counting every co-member
+        self.cf_neighbours = cf_neighbours
+        self.lsh = None  # Built from the index on first use
+        self.lsh_num_perm = lsh_num_perm
+        self.lsh_bands = lsh_bands
+        self.reload_thread = None  # Background full reload of the index
+        self.reload_lock = threading.Lock()
 
     def get_db_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return self.pool.connect()
+
+    def load_index(self):
+        """
+        Load the membership index from group_members (at startup; later
+        reloads run in the background, see reload_index_in_background)
+        """
+        conn = self.get_db_connection()
+        try:
+            users = self.index.load(conn)
+        finally:
+            conn.close()
+        # Profiles and LSH signatures are derived from the index: on a reload
+        # only those of users whose groups changed are updated
+        if users is None:
+            self.profile_cache.clear()
+            self.lsh = None
+        else:
+            self._membership_changed(users)
+
+    def reload_index_in_background(self):
+        """
+        Start a full reload of the index in another thread, unless one is
+        running. Requests keep being served from the current index
+        """
+        with self.reload_lock:
+            if self.reload_thread is not None and self.reload_thread.is_alive():
+                return
+            self.reload_thread = threading.Thread(target=self.load_index, name='index-reload', daemon=True)
+            self.reload_thread.start()
+
+    def get_index(self):
+        """
+        The membership index, first caught up with writes made by other
+        processes when a check is due. Only the very first load blocks
+        """
+        if not self.index.loaded:
+            self.load_index()
+            return self.index
+
+        if self.index.reload_due():
+            self.reload_index_in_background()
+        if self.index.check_due():
+            conn = self.get_db_connection()
+            try:
+                users = self.index.sync(conn)
+            finally:
+                conn.close()
+            if users is None:
+                # Too far behind to catch up group by group
+                self.reload_index_in_background()
+            else:
+                self._membership_changed(users)
+        return self.index
+
+    def _membership_changed(self, users):
+        for user_id in users:
+            self.profile_cache.invalidate(user_id)
+            self._update_lsh(user_id)
+
+    def get_lsh(self):
+        if self.lsh is None:
+            index = self.get_index()
+            lsh = MinHashLSH(self.lsh_num_perm, self.lsh_bands)
+            with index.lock:
+                user_groups = {user_id: set(groups) for user_id, groups in index.user_groups.items()}
+            for user_id, group_ids in user_groups.items():
+                lsh.update(user_id, group_ids)
+            self.lsh = lsh
+        return self.lsh
+
+    def _update_lsh(self, user_id):
+        if self.lsh is not None:
+            self.lsh.update(user_id, self.index.member_of(user_id))
+
+    def init_membership_changes(self, conn):
+        """
+        Create the membership change log read by MembershipIndex.sync
+        """
+        conn.executescript(MEMBERSHIP_CHANGES_SCHEMA)
+
+    def init_recommendation_tables(self, conn=None):
+        """
+        Create the precomputed recommendation tables and their triggers
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_db_connection()
+        conn.executescript(RECOMMENDATION_SCHEMA)
+        if own_conn:
+            conn.close()
+
+    # Membership events, reported by app.py after each committed write
+
+    def group_added(self, group_id, subject, max_members):
+        self.index.add_group(group_id, subject, max_members)
+
+    def group_removed(self, group_id):
+        for user_id in self.index.remove_group(group_id):
+            self.profile_cache.invalidate(user_id)
+            self._update_lsh(user_id)
+
+    def member_added(self, user_id, group_id):
+        self.index.add_member(user_id, group_id)
+        self.profile_cache.invalidate(user_id)
+        self._update_lsh(user_id)
+
+    def member_removed(self, user_id, group_id):
+        self.index.remove_member(user_id, group_id)
+        self.profile_cache.invalidate(user_id)
+        self._update_lsh(user_id)
+
+    def user_removed(self, user_id):
+        self.index.remove_user(user_id)
+        self.profile_cache.invalidate(user_id)
+        if self.lsh is not None:
+            self.lsh.remove(user_id)
 
     def calculate_similarity_score(self, user_profile, group):
         """
@@ -48,64 +800,142 @@ class MatchingEngine:
         """
         Use collaborative filtering to find groups based on similar users' preferences
         """
-        conn = self.get_db_connection()
-        
-        # Find users with similar joining patterns
-        query = '''
-            SELECT DISTINCT gm2.user_id
-            FROM group_members gm1
-            JOIN group_members gm2 ON gm1.group_id = gm2.group_id
-            WHERE gm1.user_id = ? AND gm2.user_id != ?
-        '''
-        
-        similar_users = conn.execute(query, (user_id, user_id)).fetchall()
-        
-        if not similar_users:
-            conn.close()
-            return 0.0  # No similar users found
-        
-        # Find groups that similar users joined but this user hasn't
-        similar_user_ids = [row['user_id'] for row in similar_users]
-        placeholders = ','.join('?' * len(similar_user_ids))
-        
-        query = f'''
-            SELECT sg.id, COUNT(*) as common_users
-            FROM study_groups sg
-            JOIN group_members gm ON sg.id = gm.group_id
-            WHERE gm.user_id IN ({placeholders})
-            AND sg.id NOT IN (
-                SELECT group_id FROM group_members WHERE user_id = ?
-            )
-            AND sg.id = ?
-            GROUP BY sg.id
-        '''
-        
-        result = conn.execute(query, similar_user_ids + [user_id, group['id']]).fetchone()
-        conn.close()
-        
-        if result:
-            # Normalize based on total similar users
-            cf_score = result['common_users'] / len(similar_users)
-            return min(cf_score, 1.0)
-        else:
+        if self.cf_neighbours:
+            return self.collaborative_filtering_scores(user_id).get(group['id'], 0.0)
+
+        similar_count, common_users = self.get_index().co_member_counts(user_id)
+
+        if not similar_count or group['id'] not in common_users:
+            return 0.0  # No similar users found, or none of them joined this group
+
+        # Normalize based on total similar users
+        cf_score = common_users[group['id']] / similar_count
+        return min(cf_score, 1.0)
+
+    def collaborative_filtering_scores(self, user_id):
+        """
+        Batch version of collaborative_filtering_score: return a dict of
+        group_id -> cf_score for every group the user has not joined.
+        Groups with no similar members are omitted (their score is 0.0)
+        """
+        if self.cf_neighbours:
+            return self.weighted_collaborative_filtering_scores(user_id, self.cf_neighbours)
+
+        similar_count, common_users = self.get_index().co_member_counts(user_id)
+
+        # Same normalization as collaborative_filtering_score
+        return {
+            group_id: min(count / similar_count, 1.0)
+            for group_id, count in common_users.items()
+        }
+
+    def jaccard(self, groups_a, groups_b):
+        if not groups_a or not groups_b:
             return 0.0
+        return len(groups_a & groups_b) / len(groups_a | groups_b)
+
+    def similar_users(self, user_id, k=20):
+        """
+        Return the top k users by Jaccard similarity of their groups, as
+        [(user_id, jaccard)], using the LSH index to find candidates
+        """
+        index = self.get_index()
+        own_groups = index.member_of(user_id)
+
+        neighbours = []
+        for other_id in self.get_lsh().candidates(user_id):
+            similarity = self.jaccard(own_groups, index.member_of(other_id))
+            if similarity > 0:
+                neighbours.append((other_id, similarity))
+
+        return heapq.nsmallest(k, neighbours, key=lambda n: (-n[1], n[0]))
+
+    def exact_similar_users(self, user_id, k=20):
+        """
+        Exact counterpart of similar_users, comparing against every co-member
+        (the only users with a non-zero Jaccard similarity)
+        """
+        index = self.get_index()
+        own_groups = index.member_of(user_id)
+
+        neighbours = [
+            (other_id, self.jaccard(own_groups, index.member_of(other_id)))
+            for other_id in index.co_members(user_id)
+        ]
+        return heapq.nsmallest(k, neighbours, key=lambda n: (-n[1], n[0]))
+
+    def weighted_collaborative_filtering_scores(self, user_id, k=20):
+        """
+        CF scores from the top k LSH neighbours: each group the user has not
+        joined scores the Jaccard-weighted share of neighbours who joined it
+        """
+        index = self.get_index()
+        neighbours = self.similar_users(user_id, k)
+        total_weight = sum(similarity for other_id, similarity in neighbours)
+        if not total_weight:
+            return {}
+
+        own_groups = index.member_of(user_id)
+        weights = defaultdict(float)
+        for other_id, similarity in neighbours:
+            for group_id in index.member_of(other_id):
+                if group_id not in own_groups and group_id in index.groups:
+                    weights[group_id] += similarity
+
+        return {
+            group_id: min(weight / total_weight, 1.0)
+            for group_id, weight in weights.items()
+        }
+
+    def benchmark_lsh_recall(self, k=10, sample=200, seed=1):
+        """
+        Compare similar_users against exact_similar_users on a sample of
+        users. Returns recall@k and the average query time of each
+        """
+        index = self.get_index()
+        self.get_lsh()
+        with index.lock:
+            users = sorted(user_id for user_id, groups in index.user_groups.items() if groups)
+        users = random.Random(seed).sample(users, min(sample, len(users)))
+
+        found = relevant = 0
+        lsh_time = exact_time = 0.0
+        for user_id in users:
+            started = time.perf_counter()
+            approximate = self.similar_users(user_id, k)
+            lsh_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            exact = self.exact_similar_users(user_id, k)
+            exact_time += time.perf_counter() - started
+
+            # Count a hit for any returned neighbour at least as similar as the
+            # exact k-th one, so ties at the cut-off are not counted as misses
+            if exact:
+                cutoff = exact[-1][1]
+                found += min(len(exact), sum(1 for _, similarity in approximate if similarity >= cutoff))
+                relevant += len(exact)
+
+        return {
+            'users': len(users),
+            'k': k,
+            'recall': found / relevant if relevant else 1.0,
+            'lsh_ms_per_query': 1000 * lsh_time / len(users) if users else 0.0,
+            'exact_ms_per_query': 1000 * exact_time / len(users) if users else 0.0
+        }
 
     def get_user_profile(self, user_id):
         """
-        Get user profile based on their past behavior and preferences
+        Get user profile based on their past behavior and preferences.
+        Profiles are cached; callers must not modify the returned dict
         """
-        conn = self.get_db_connection()
-        
-        # Get user's joined groups to understand preferences
-        query = '''
-            SELECT sg.subject, sg.name, sg.max_members
-            FROM study_groups sg
-            JOIN group_members gm ON sg.id = gm.group_id
-            WHERE gm.user_id = ?
-        '''
-        
-        user_groups = conn.execute(query, (user_id,)).fetchall()
-        conn.close()
+        profile = self.profile_cache.get(user_id)
+        if profile is not None:
+            return profile
+        generation = self.profile_cache.generation
+
+        # Get user's joined groups (subject, max_members) to understand preferences
+        user_groups = self.get_index().groups_of(user_id)
         
         profile = {
             'preferred_subjects': [],
@@ -116,11 +946,11 @@ class MatchingEngine:
         
         if user_groups:
             # Analyze patterns in user's joined groups
-            subjects = [g['subject'] for g in user_groups]
+            subjects = [subject for subject, max_members in user_groups]
             # goals and dates are not available in our schema
             goals = []
             dates = []
-            sizes = [g['max_members'] for g in user_groups]
+            sizes = [max_members for subject, max_members in user_groups]
             
             # Most common preferences
             profile['preferred_subjects'] = self.most_common(subjects, n=3)
@@ -131,6 +961,7 @@ class MatchingEngine:
             avg_size = sum(sizes) / len(sizes) if sizes else 10
             profile['preferred_group_size'] = 'small' if avg_size <= 4 else 'large'
         
+        self.profile_cache.put(user_id, profile, generation)
         return profile
 
     def most_common(self, lst, n=1):
@@ -150,52 +981,131 @@ class MatchingEngine:
         Get group recommendations for a user using hybrid approach
         (rules + collaborative filtering)
         """
-        conn = self.get_db_connection()
-        
-        # Get all available groups (not full and not joined by user)
-        query = '''
-            SELECT sg.*
-            FROM study_groups sg
-            WHERE sg.current_members < sg.max_members
-            AND sg.id NOT IN (
-                SELECT group_id FROM group_members WHERE user_id = ?
-            )
-        '''
-        
-        available_groups = conn.execute(query, (user_id,)).fetchall()
-        conn.close()
-        
-        if not available_groups:
-            return []
-        
         # Get user profile
         user_profile = self.get_user_profile(user_id)
+        joined_groups = self.get_index().member_of(user_id)
+
+        conn = self.get_db_connection()
         
-        # Calculate scores for each group
-        scored_groups = []
-        for group in available_groups:
-            group_dict = dict(group)
-            
+        # Available groups (not full and not joined by user), streamed from the cursor
+        available_groups = (
+            group for group in conn.execute(RECOMMENDATION_CANDIDATES_QUERY)
+            if group['id'] not in joined_groups
+        )
+
+        if self.vectorized:
+            scored_groups = self.score_groups_vectorized(user_id, user_profile, list(available_groups), limit)
+            conn.close()
+            return scored_groups
+
+        # Collaborative filtering scores for all candidate groups in one pass
+        cf_scores = self.collaborative_filtering_scores(user_id)
+
+        def score(group):
             # Calculate rules-based score
-            rules_score = self.calculate_similarity_score(user_profile, group_dict)
-            
-            # Calculate collaborative filtering score
-            cf_score = self.collaborative_filtering_score(user_id, group_dict)
+            rules_score = self.calculate_similarity_score(user_profile, group)
+
+            # Look up collaborative filtering score
+            cf_score = cf_scores.get(group['id'], 0.0)
             
             # Hybrid score (50% rules, 50% collaborative filtering)
             final_score = 0.5 * rules_score + 0.5 * cf_score
             
-            scored_groups.append({
-                'group': group_dict,
-                'rules_score': rules_score,
-                'cf_score': cf_score,
-                'final_score': final_score
-            })
-        
-        # Sort by final score (descending) and return top recommendations
-        scored_groups.sort(key=lambda x: x['final_score'], reverse=True)
+            return final_score, rules_score, cf_score, group
+
+        # Keep only the best `limit` groups in a bounded heap, so memory stays
+        # O(limit) however many groups there are. Equal scores are ranked by
+        # lowest group id so the results are reproducible
+        top_groups = heapq.nlargest(
+            limit,
+            (score(group) for group in available_groups),
+            key=lambda scored: (scored[0], -scored[3]['id'])
+        )
+        conn.close()
         
-        return scored_groups[:limit]
+        return [{
+            'group': dict(group),
+            'rules_score': rules_score,
+            'cf_score': cf_score,
+            'final_score': final_score
+        } for final_score, rules_score, cf_score, group in top_groups]
+
+    def score_groups_vectorized(self, user_id, user_profile, groups, limit):
+        """
+        Vectorized equivalent of the scoring loop in get_recommendations.
+        Subject, max_members and CF co-counts of all groups are encoded as
+        arrays, the scores computed in one array pass and the top `limit`
+        picked with argpartition. Results match the scalar path exactly,
+        including ties (broken by lowest group id, i.e. candidate order)
+        """
+        n = len(groups)
+        k = min(limit, n)
+        if k <= 0:
+            return []
+
+        # Encode candidate groups as arrays
+        subject_codes = {}
+        subjects = np.fromiter(
+            (subject_codes.setdefault(g['subject'], len(subject_codes)) for g in groups),
+            dtype=np.int64, count=n
+        )
+        max_members = np.fromiter((g['max_members'] for g in groups), dtype=np.float64, count=n)
+
+        if self.cf_neighbours:
+            weighted_scores = self.weighted_collaborative_filtering_scores(user_id, self.cf_neighbours)
+        else:
+            similar_count, common_users = self.get_index().co_member_counts(user_id)
+            common = np.fromiter(
+                (common_users.get(g['id'], 0) for g in groups), dtype=np.float64, count=n
+            )
+
+        # Rules-based score, accumulated in the same order as calculate_similarity_score.
+        # (The primary subject bonus there can never apply: the primary subject
+        # is always in preferred_subjects and already matched the 40% branch)
+        rules_scores = np.zeros(n)
+        preferred_subjects = user_profile.get('preferred_subjects')
+        if preferred_subjects:
+            preferred_codes = [subject_codes[s] for s in preferred_subjects if s in subject_codes]
+            rules_scores += np.where(np.isin(subjects, preferred_codes), 0.40, 0.0)
+
+        preferred_group_size = user_profile.get('preferred_group_size')
+        if preferred_group_size == 'small':
+            rules_scores += np.where(max_members <= 4, 0.10, 0.0)
+        elif preferred_group_size == 'large':
+            rules_scores += np.where(max_members > 4, 0.10, 0.0)
+        rules_scores = np.minimum(rules_scores, 1.0)
+
+        # Collaborative filtering score
+        if self.cf_neighbours:
+            cf_scores = np.fromiter(
+                (weighted_scores.get(g['id'], 0.0) for g in groups), dtype=np.float64, count=n
+            )
+        elif similar_count:
+            cf_scores = np.minimum(common / similar_count, 1.0)
+        else:
+            cf_scores = np.zeros(n)
+
+        # Hybrid score (50% rules, 50% collaborative filtering)
+        final_scores = 0.5 * rules_scores + 0.5 * cf_scores
+
+        # Top k: argpartition picks arbitrarily among groups tied at the
+        # cut-off score, so keep the earliest of those like a stable sort would
+        if k < n:
+            top = np.argpartition(-final_scores, k - 1)[:k]
+            cutoff = final_scores[top].min()
+            above = np.flatnonzero(final_scores > cutoff)
+            tied = np.flatnonzero(final_scores == cutoff)[:k - len(above)]
+            top = np.concatenate([above, tied])
+        else:
+            top = np.arange(n)
+        top = top[np.lexsort((top, -final_scores[top]))]
+
+        return [{
+            'group': dict(groups[i]),
+            'rules_score': float(rules_scores[i]),
+            'cf_score': float(cf_scores[i]),
+            'final_score': float(final_scores[i])
+        } for i in top]
 
     def get_group_compatibility(self, user_id, group_id):
         """
@@ -230,11 +1140,297 @@ class MatchingEngine:
             'final_score': final_score
         }
 
-# Example usage
+    def get_group_compatibility_many(self, user_id, group_ids):
+        """
+        Calculate compatibility between a user and many groups at once.
+        The profile and co-membership data are computed once and all groups
+        fetched in one query. Returns {group_id: result} in the same format
+        as get_group_compatibility; unknown group ids are left out
+        """
+        group_ids = list(dict.fromkeys(group_ids))
+        if not group_ids:
+            return {}
+
+        conn = self.get_db_connection()
+        groups = conn.execute(GROUPS_BY_ID_QUERY, (json.dumps(group_ids),)).fetchall()
+        conn.close()
+
+        # Get user profile and collaborative filtering scores once
+        user_profile = self.get_user_profile(user_id)
+        cf_scores = self.collaborative_filtering_scores(user_id)
+
+        results = {}
+        for group in groups:
+            group_dict = dict(group)
+            rules_score = self.calculate_similarity_score(user_profile, group_dict)
+            cf_score = cf_scores.get(group_dict['id'], 0.0)
+            final_score = 0.5 * rules_score + 0.5 * cf_score
+
+            results[group_dict['id']] = {
+                'group': group_dict,
+                'rules_score': rules_score,
+                'cf_score': cf_score,
+                'final_score': final_score
+            }
+
+        return results
+
+    def get_precomputed_recommendations(self, user_id, limit=10, max_changed_groups=200):
+        """
+        Serve recommendations from the user_recommendations table.
+        Returns None when the user has no precomputed list, or when their own
+        memberships or the groups their profile is built from changed since
+        the last finished refresh, in which case the caller should fall back
+        to get_recommendations. Changes to other groups don't make the list
+        stale: full and deleted groups are left out, and groups created or
+        changed since the refresh are scored live and merged in
+        """
+        conn = self.get_db_connection()
+
+        try:
+            run = conn.execute(LAST_REFRESH_QUERY).fetchone()
+        except sqlite3.OperationalError:
+            conn.close()
+            return None  # Refresh job never set up
+
+        state = conn.execute(RECOMMENDATION_STATE_QUERY, (user_id,)).fetchone()
+
+        if not run or not state:
+            conn.close()
+            return None
+
+        own_groups = self.get_index().member_of(user_id)
+
+        stale = conn.execute(
+            RECOMMENDATION_STALENESS_QUERY, (run['last_event_id'], user_id, json.dumps(list(own_groups)))
+        ).fetchone()
+
+        if stale:
+            conn.close()
+            return None
+
+        # Groups created, deleted, filled up or otherwise changed since the refresh
+        changed_groups = [row['group_id'] for row in conn.execute(CHANGED_GROUPS_QUERY, (run['last_event_id'],))]
+        if len(changed_groups) > max_changed_groups:
+            conn.close()
+            return None
+
+        rows = conn.execute(
+            PRECOMPUTED_RECOMMENDATIONS_QUERY, (user_id, json.dumps(changed_groups), limit)
+        ).fetchall()
+        conn.close()
+
+        recommendations = []
+        for row in rows:
+            group_dict = dict(row)
+            recommendations.append({
+                'rules_score': group_dict.pop('rec_rules_score'),
+                'cf_score': group_dict.pop('rec_cf_score'),
+                'final_score': group_dict.pop('rec_final_score'),
+                'group': group_dict
+            })
+
+        if changed_groups:
+            for result in self.get_group_compatibility_many(user_id, changed_groups).values():
+                group = result['group']
+                if group['current_members'] < group['max_members'] and group['id'] not in own_groups:
+                    recommendations.append(result)
+            # Same order as get_recommendations: best score first, then lowest group id
+            recommendations.sort(key=lambda rec: (-rec['final_score'], rec['group']['id']))
+            recommendations = recommendations[:limit]
+
+        if not recommendations:
+            return None  # Everything stored filled up or went away
+        return recommendations
+
+    def users_affected_by_groups(self, conn, group_ids, stored):
+        """
+        Users whose stored recommendations can change because the given open
+        groups were created or changed. Without one of their
+        preferred subjects or a co-member in the group a user scores it at
+        most SIZE_ONLY_SCORE, so
+        it can only enter their list if that holds fewer than `stored` rows
+        or a row scoring no more than that. Also the groups' members (their
+        profile changed) and the users who stored one of the groups (its score
+        changed)
+        """
+        index = self.index
+        users = set()
+        for group_id in group_ids:
+            for member in index.members(group_id):
+                users.add(member)
+                users.update(index.co_members(member))
+
+        subjects = {
+            row['subject'] for row in conn.execute(GROUPS_BY_ID_QUERY, (json.dumps(list(group_ids)),))
+        }
+        with index.lock:
+            subject_groups = [group_id for group_id, (subject, _) in index.groups.items() if subject in subjects]
+        for group_id in subject_groups:
+            for user_id in index.members(group_id):
+                if user_id not in users and subjects.intersection(self.get_user_profile(user_id)['preferred_subjects']):
+                    users.add(user_id)
+
+        users.update(row[0] for row in conn.execute(
+            AFFECTED_STORED_USERS_QUERY, (json.dumps(list(group_ids)), stored, SIZE_ONLY_SCORE)
+        ))
+        return users
+
+    def refresh_recommendations(self, limit=10, full=False, batch_size=500, spare=10):
+        """
+        Precompute the top `limit` recommendations into user_recommendations,
+        plus `spare` more to take the place of groups that fill up or are
+        deleted before the next refresh.
+        Incremental unless `full` (or on the first run): only users whose
+        neighbourhood changed since the last finished run, or who can rank a
+        group changed since (see users_affected_by_groups), are recomputed,
+        plus users that were never computed. Returns a summary dict
+        """
+        conn = self.get_db_connection()
+        self.init_recommendation_tables(conn)
+
+        last_run = conn.execute(LAST_REFRESH_QUERY).fetchone()
+
+        # Read the event high-water mark before loading any data, so that
+        # changes made while we compute are picked up again by the next run
+        high_water = conn.execute('SELECT COALESCE(MAX(id), 0) FROM recommendation_events').fetchone()[0]
+        self.load_index()
+        index = self.index
+
+        all_users = [row['id'] for row in conn.execute('SELECT id FROM users')]
+        full = full or last_run is None
+        deleted_users = set()
+        closed_groups = set()
+
+        if full:
+            users = set(all_users)
+        else:
+            events = conn.execute(
+                'SELECT user_id, group_id FROM recommendation_events WHERE id > ? AND id <= ?',
+                (last_run['last_event_id'], high_water)
+            ).fetchall()
+
+            # A membership change of user x in group g affects x, the members
+            # of g and everyone sharing a group with x
+            users = set()
+            changed_groups = set()
+            closed_groups = set()
+            for event in events:
+                if event['user_id'] is None:
+                    changed_groups.add(event['group_id'])
+                    continue
+                users.add(event['user_id'])
+                users.update(index.members(event['group_id']))
+                users.update(index.co_members(event['user_id']))
+
+            # A group that appeared or changed only affects the users who can
+            # rank it. One that filled up or went away is just dropped from the
+            # stored lists, whose order is otherwise unchanged; lists left too
+            # short are recomputed by a later run
+            open_groups = {
+                row['id'] for row in conn.execute(GROUPS_BY_ID_QUERY, (json.dumps(list(changed_groups)),))
+                if row['current_members'] < row['max_members']
+            }
+            closed_groups = changed_groups - open_groups
+            for group_id in closed_groups:
+                users.update(index.members(group_id))  # Their profile may have changed too
+            if open_groups:
+                users.update(self.users_affected_by_groups(conn, open_groups, limit + spare))
+
+            computed = {row['user_id'] for row in conn.execute('SELECT user_id FROM user_recommendation_state')}
+            users.update(user_id for user_id in all_users if user_id not in computed)
+            deleted_users = users - set(all_users)
+            users.intersection_update(all_users)
+
+        cursor = conn.execute(
+            'INSERT INTO recommendation_runs (full_refresh) VALUES (?)', (int(full),)
+        )
+        generation = cursor.lastrowid
+        conn.commit()
+
+        # Write in batches so that each write transaction stays short
+        users = sorted(users)
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            results = [(user_id, self.get_recommendations(user_id, limit=limit + spare)) for user_id in batch]
+
+            conn.execute('BEGIN IMMEDIATE')
+            for user_id, recommendations in results:
+                conn.execute('DELETE FROM user_recommendations WHERE user_id = ?', (user_id,))
+                conn.executemany(
+                    'INSERT INTO user_recommendations (user_id, rank, group_id, rules_score, cf_score, final_score) VALUES (?, ?, ?, ?, ?, ?)',
+                    [(user_id, rank, rec['group']['id'], rec['rules_score'], rec['cf_score'], rec['final_score'])
+                     for rank, rec in enumerate(recommendations)]
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO user_recommendation_state (user_id, generation) VALUES (?, ?)',
+                    (user_id, generation)
+                )
+            conn.commit()
+
+        conn.execute('BEGIN IMMEDIATE')
+        if full:
+            # Drop lists of deleted users
+            conn.execute('DELETE FROM user_recommendations WHERE user_id NOT IN (SELECT id FROM users)')
+            conn.execute('DELETE FROM user_recommendation_state WHERE user_id NOT IN (SELECT id FROM users)')
+        else:
+            conn.execute(
+                'DELETE FROM user_recommendations WHERE group_id IN (SELECT value FROM json_each(?))',
+                (json.dumps(list(closed_groups)),)
+            )
+            for user_id in deleted_users:
+                conn.execute('DELETE FROM user_recommendations WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM user_recommendation_state WHERE user_id = ?', (user_id,))
+        conn.execute(
+            'UPDATE recommendation_runs SET last_event_id = ?, users_updated = ?, finished_at = CURRENT_TIMESTAMP WHERE generation = ?',
+            (high_water, len(users), generation)
+        )
+        # Every user is now either recomputed or unaffected by these events
+        conn.execute('DELETE FROM recommendation_events WHERE id <= ?', (high_water,))
+        conn.commit()
+        conn.close()
+
+        return {'generation': generation, 'full_refresh': full, 'users_updated': len(users)}
+
 if __name__ == "__main__":
-    engine = MatchingEngine()
-    
-    # Example: Get recommendations for user with ID 1
-    # recommendations = engine.get_recommendations(user_id=1, limit=5)
-    # for rec in recommendations:
-    #     print(f"Group: {rec['group']['subject']} - Score: {rec['final_score']:.2f}")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Study group matching engine jobs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    refresh_parser = subparsers.add_parser(
+        'refresh', help='Precompute recommendations into the user_recommendations table'
+    )
+    refresh_parser.add_argument('--db', default='study_groups.db', help='Path to the SQLite database')
+    refresh_parser.add_argument('--limit', type=int, default=10, help='Recommendations stored per user')
+    refresh_parser.add_argument('--spare', type=int, default=10,
+                                help='Extra recommendations stored per user, served when stored groups fill up')
+    refresh_parser.add_argument('--full', action='store_true', help='Recompute every user, not only changed ones')
+    refresh_parser.add_argument('--interval', type=float, default=0,
+                                help='Keep running, refreshing every INTERVAL seconds')
+
+    recall_parser = subparsers.add_parser(
+        'lsh-recall', help='Benchmark LSH neighbour recall against exact Jaccard'
+    )
+    recall_parser.add_argument('--db', default='study_groups.db', help='Path to the SQLite database')
+    recall_parser.add_argument('--k', type=int, default=10, help='Neighbours per user')
+    recall_parser.add_argument('--sample', type=int, default=200, help='Number of users to sample')
+    recall_parser.add_argument('--num-perm', type=int, default=128, help='MinHash permutations')
+    recall_parser.add_argument('--bands', type=int, default=64, help='LSH bands (num-perm / bands rows each)')
+
+    args = parser.parse_args()
+
+    if args.command == 'refresh':
+        engine = MatchingEngine(args.db)
+        while True:
+            started = time.monotonic()
+            summary = engine.refresh_recommendations(limit=args.limit, full=args.full, spare=args.spare)
+            print(f"Generation {summary['generation']}: {summary['users_updated']} users updated "
+                  f"({'full' if summary['full_refresh'] else 'incremental'}) in {time.monotonic() - started:.2f}s")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
+
+    elif args.command == 'lsh-recall':
+        engine = MatchingEngine(args.db, lsh_num_perm=args.num_perm, lsh_bands=args.bands)
+        result = engine.benchmark_lsh_recall(k=args.k, sample=args.sample)
+        print(f"recall@{result['k']} over {result['users']} users: {result['recall']:.3f}")
+        print(f"LSH: {result['lsh_ms_per_query']:.3f} ms/query, exact: {result['exact_ms_per_query']:.3f} ms/query")
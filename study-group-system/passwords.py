@@ -0,0 +1,174 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when no hashing slot frees up within queue_timeout seconds"""
+
+
+def hash_method(password_hash):
+    """The method and parameters a hash was made with, e.g. pbkdf2:sha256:600000"""
+    return password_hash.split('$', 1)[0]
+
+
+def canonical_method(method):
+    """
+    The hash_method() prefix that generate_password_hash(method=method)
+    produces, with Werkzeug's defaults filled in, without hashing anything
+    """
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    if name == 'scrypt':
+        return 'scrypt:' + ':'.join(args) if args else 'scrypt:32768:8:1'
+    return method
+
+
+# Run in the worker processes
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password, method, rehash):
+    """
+    (matches, new hash or None). With rehash, the password is rehashed in
+    the same call when its hash was made with other parameters than method
+    """
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if rehash and hash_method(password_hash) != canonical_method(method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+class PasswordHasher:
+    """
+    Password hashing and checking for register/login, run in a pool of
+    `workers` processes so that the deliberately slow key derivation
+    doesn't tie up request threads (or the GIL). workers=0 hashes inline.
+
+    At most max_pending calls are queued or running at once; a caller that
+    finds the queue full waits up to queue_timeout seconds for a slot and
+    then gets HasherBusy, so a login storm is turned away early instead of
+    piling up behind the pool. The processes are started on first use.
+
+    method defaults to Werkzeug's own default. Stored hashes made with
+    other parameters are only upgraded at login when rehash is set
+    """
+    def __init__(self, method='pbkdf2', workers=None, max_pending=64, queue_timeout=5, rehash=False):
+        self.method = method
+        self.rehash = rehash
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.executor = None
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                # spawn rather than fork: the app forks from a multi-threaded server
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+            return self.executor
+
+    def _run(self, fn, *args):
+        queued_at = time.monotonic()
+        with self.lock:
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.queue_timeout)
+        with self.lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+                raise HasherBusy('Password hashing queue is full')
+            self.pending += 1
+            self.peak_pending = max(self.peak_pending, self.pending)
+
+        started = time.monotonic()
+        try:
+            if self.workers:
+                return self._get_executor().submit(fn, *args).result()
+            return fn(*args)
+        finally:
+            self.slots.release()
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+                self.wait_seconds += started - queued_at
+                self.run_seconds += time.monotonic() - started
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """
+        Hash a batch of passwords spread over all the workers, for bulk
+        imports. Not subject to max_pending
+        """
+        passwords = list(passwords)
+        if self.workers and len(passwords) > 1:
+            chunksize = max(1, len(passwords) // (self.workers * 4))
+            hashes = list(self._get_executor().map(
+                _hash, passwords, itertools.repeat(self.method), chunksize=chunksize
+            ))
+        else:
+            hashes = [_hash(password, self.method) for password in passwords]
+        with self.lock:
+            self.completed += len(hashes)
+        return hashes
+
+    def verify(self, password_hash, password):
+        """
+        (matches, new hash or None). With rehash set, a new hash is returned
+        when the stored one was made with other parameters; store it to
+        upgrade the user
+        """
+        matches, new_hash = self._run(_verify, password_hash, password, self.method, self.rehash)
+        if new_hash is not None:
+            with self.lock:
+                self.rehashed += 1
+        return matches, new_hash
+
+    def close(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'method': canonical_method(self.method),
+                'rehash': self.rehash,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'running': min(self.pending, self.workers) if self.workers else self.pending,
+                # Calls waiting for a worker process or for a slot
+                'queue_depth': self.waiting + (max(self.pending - self.workers, 0) if self.workers else 0),
+                'peak_pending': self.peak_pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'avg_wait_ms': self.wait_seconds / self.completed * 1000 if self.completed else 0.0,
+                'avg_run_ms': self.run_seconds / self.completed * 1000 if self.completed else 0.0
+            }
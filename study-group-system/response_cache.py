@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    In-memory cache for per-user and per-group page data (/my-groups,
+    /group/<id>), validated against data versions instead of expiring on a
+    timer.
+
+    Every user and group has a version, taken from one monotonically
+    increasing counter, which the routes bump after each committed change
+    to it. An entry records the versions of everything it was built from
+    and is served only while all of them are unchanged. ttl bounds how
+    long a change made outside the app (e.g. consistency.py --repair) can
+    go unnoticed.
+
+    Versions are kept per dependency only while a cached entry refers to
+    it, so memory is bounded by maxsize. Other versions are folded into a
+    fixed number of buckets holding the highest version of any dependency
+    that hashes there: an upper bound, which can only make put() skip
+    more often, never serve stale data
+    """
+    def __init__(self, maxsize=4096, ttl=60, buckets=1024):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.counter = 0
+        self.versions = {}  # ('user', id) or ('group', id) -> version, for dependencies of cached entries
+        self.refs = {}  # dependency -> number of cached entries built from it
+        self.buckets = [0] * buckets
+        self.entries = OrderedDict()  # key -> (stored_at, {dependency: version}, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, dependency):
+        if dependency in self.versions:
+            return self.versions[dependency]
+        return self.buckets[hash(dependency) % len(self.buckets)]
+
+    def _remove(self, key):
+        """Drop an entry, and the versions no other entry refers to"""
+        _, dependencies, _ = self.entries.pop(key)
+        for dependency in dependencies:
+            self.refs[dependency] -= 1
+            if not self.refs[dependency]:
+                del self.refs[dependency]
+                bucket = hash(dependency) % len(self.buckets)
+                self.buckets[bucket] = max(self.buckets[bucket], self.versions.pop(dependency))
+
+    def current_version(self):
+        """Read before loading data from the database; pass to put()"""
+        with self.lock:
+            return self.counter
+
+    def bump(self, *dependencies):
+        """Mark users/groups as changed, invalidating every entry built from them"""
+        with self.lock:
+            self.counter += 1
+            for dependency in dependencies:
+                if dependency in self.versions:
+                    self.versions[dependency] = self.counter
+                else:
+                    self.buckets[hash(dependency) % len(self.buckets)] = self.counter
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                stored_at, dependencies, value = entry
+                if time.monotonic() - stored_at < self.ttl and all(
+                    self.versions[dependency] == version
+                    for dependency, version in dependencies.items()
+                ):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, dependencies, loaded_at_version):
+        """
+        Cache value, built from data read after current_version() returned
+        loaded_at_version. Skipped if any dependency changed since then,
+        since the data read may predate that change
+        """
+        with self.lock:
+            versions = {dependency: self._version(dependency) for dependency in dependencies}
+            if any(version > loaded_at_version for version in versions.values()):
+                return
+            if key in self.entries:
+                self._remove(key)
+            for dependency, version in versions.items():
+                self.versions.setdefault(dependency, version)
+                self.refs[dependency] = self.refs.get(dependency, 0) + 1
+            self.entries[key] = (time.monotonic(), versions, value)
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'tracked_versions': len(self.versions),
+                'version': self.counter
+            }
@@ -1,8 +1,7 @@
 // Run when the page loads
 document.addEventListener('DOMContentLoaded', function() {
     // Load subjects and goals dynamically
-    loadSubjects();
-    loadGoals();
+    loadFacets();
     
     // Load groups from backend and display them (this will handle auth)
     loadAndDisplayGroups();
@@ -22,45 +21,45 @@ document.addEventListener('DOMContentLoaded', function() {
         loadAndDisplayGroups(); // Refresh groups with filters
         generateAIRecommendations(); // Trigger AI recommendations
     });
+
+    // Pressing Enter in the search box searches straight away
+    document.getElementById('searchQuery').addEventListener('keydown', function(e) {
+        if (e.key === 'Enter') {
+            e.preventDefault();
+            loadAndDisplayGroups();
+        }
+    });
 });
 
-function loadSubjects() {
-    fetch('/api/subjects')
+// Load the subject and goal dropdowns, with open-group counts, in one call
+function loadFacets() {
+    fetch('/api/facets')
         .then(response => response.json())
         .then(data => {
             const subjectSelect = document.getElementById('filterSubject');
             // Keep the 'All Subjects' option
             subjectSelect.innerHTML = '<option value="all">All Subjects</option>';
             
-            data.forEach(subject => {
+            data.subjects.forEach(subject => {
                 const option = document.createElement('option');
                 option.value = subject.subject;
-                option.textContent = formatSubjectName(subject.subject);
+                option.textContent = `${formatSubjectName(subject.subject)} (${subject.open_groups} open)`;
                 subjectSelect.appendChild(option);
             });
-        })
-        .catch(error => {
-            console.error('Error loading subjects:', error);
-        });
-}
 
-function loadGoals() {
-    fetch('/api/goals')
-        .then(response => response.json())
-        .then(data => {
             const goalSelect = document.getElementById('filterGoal');
             // Keep the 'All Goals' option
             goalSelect.innerHTML = '<option value="all">All Goals</option>';
             
-            data.forEach(goal => {
+            data.goals.forEach(goal => {
                 const option = document.createElement('option');
                 option.value = goal.goal;
-                option.textContent = formatGoalName(goal.goal);
+                option.textContent = `${formatGoalName(goal.goal)} (${goal.open_groups} open)`;
                 goalSelect.appendChild(option);
             });
         })
         .catch(error => {
-            console.error('Error loading goals:', error);
+            console.error('Error loading subjects and goals:', error);
         });
 }
 
@@ -95,15 +94,25 @@ function formatGoalName(goalCode) {
     return goalMap[goalCode] || goalCode.replace(/([A-Z])/g, ' $1').replace(/^./, str => str.toUpperCase());
 }
 
-// Function to load groups and apply filters from backend
-function loadAndDisplayGroups() {
+// Groups fetched per page, and the fields the group cards actually use
+const GROUPS_PAGE_SIZE = 50;
+const GROUP_CARD_FIELDS = 'id,subject,goal,date,time,location,current_members,max_members';
+
+// Function to load groups and apply filters from backend. Without a cursor
+// the list is replaced by the first page; with one the next page is appended
+function loadAndDisplayGroups(cursor) {
     // Get filter values from the dropdowns
     const filterSubject = document.getElementById('filterSubject').value;
     const filterDate = document.getElementById('filterDate').value;
     const filterGoal = document.getElementById('filterGoal').value;
+    const searchQuery = document.getElementById('searchQuery').value.trim();
 
     // Build query parameters
     const params = new URLSearchParams(); 
+    if (searchQuery) {
+        // Full-text search, best matches first
+        params.append('q', searchQuery);
+    }
     if (filterSubject && filterSubject !== 'all') {
         params.append('subject', filterSubject);
     }
@@ -113,10 +122,17 @@ function loadAndDisplayGroups() {
     if (filterDate && filterDate !== 'all') {
         params.append('date', filterDate);
     }
+    params.append('page_size', GROUPS_PAGE_SIZE);
+    params.append('fields', GROUP_CARD_FIELDS);
+    if (cursor) {
+        params.append('cursor', cursor);
+    }
 
     // Show loading indicator
     const groupsList = document.getElementById('groupsList');
-    groupsList.innerHTML = '<p>Loading groups...</p>';
+    if (!cursor) {
+        groupsList.innerHTML = '<p>Loading groups...</p>';
+    }
 
     // Fetch groups from backend - use POST to avoid potential redirect issues with GET
     fetch(`/find-group?${params}&format=json`, {
@@ -154,13 +170,14 @@ function loadAndDisplayGroups() {
                 return JSON.parse(responseText);
             }
         })
-        .then(groups => {
-            if (groups === null) {
+        .then(page => {
+            if (page === null) {
                 // Authentication failure already handled by redirecting
                 return;
             }
-            // Display the groups
-            displayGroups(groups);
+            // Display the groups, with a "Load more" button if there are more pages
+            displayGroups(page.groups, Boolean(cursor));
+            displayLoadMoreButton(page.next_cursor);
         })
         .catch(error => {
             console.error('Error fetching groups:', error);
@@ -196,26 +213,30 @@ function isDateInRange(groupDate, range) {
 }
 
 // Function to display groups on the page (YOUR EXISTING CODE)
-function displayGroups(groups) {
+function displayGroups(groups, append) {
     const groupsList = document.getElementById('groupsList');
+    let groupsContainer = groupsList.querySelector('.groups-container');
 
-    // Ensure we completely clear the content before adding new content
-    groupsList.innerHTML = '';
-    
-    // Additional safety: remove all child nodes to ensure complete clearing
-    while (groupsList.firstChild) {
-        groupsList.removeChild(groupsList.firstChild);
-    }
+    if (!append || !groupsContainer) {
+        // Ensure we completely clear the content before adding new content
+        groupsList.innerHTML = '';
+        
+        // Additional safety: remove all child nodes to ensure complete clearing
+        while (groupsList.firstChild) {
+            groupsList.removeChild(groupsList.firstChild);
+        }
 
-    // If no groups found, show message
-    if (groups.length === 0) {
-        groupsList.innerHTML = '<p>No groups found. Try adjusting your filters or create a new group!</p>';
-        return;
-    }
+        // If no groups found, show message
+        if (groups.length === 0) {
+            groupsList.innerHTML = '<p>No groups found. Try adjusting your filters or create a new group!</p>';
+            return;
+        }
 
-    // Create a container for the group cards to apply grid layout
-    const groupsContainer = document.createElement('div');
-    groupsContainer.className = 'groups-container';
+        // Create a container for the group cards to apply grid layout
+        groupsContainer = document.createElement('div');
+        groupsContainer.className = 'groups-container';
+        groupsList.appendChild(groupsContainer);
+    }
 
     // Loop through groups and create a card for each
     groups.forEach(group => {
@@ -252,13 +273,33 @@ function displayGroups(groups) {
         groupsContainer.appendChild(groupCard);
     });
 
-    // Add the container to the groups list
-    groupsList.appendChild(groupsContainer);
-
     // Add click events to all "Join This Group" buttons
     addJoinButtonEvents();
 }
 
+// Show a "Load more" button under the groups while there is a next page
+function displayLoadMoreButton(nextCursor) {
+    const groupsList = document.getElementById('groupsList');
+    const existingButton = document.getElementById('loadMoreBtn');
+    if (existingButton) {
+        existingButton.remove();
+    }
+    if (!nextCursor) {
+        return;
+    }
+
+    const loadMoreButton = document.createElement('button');
+    loadMoreButton.id = 'loadMoreBtn';
+    loadMoreButton.className = 'btn';
+    loadMoreButton.textContent = 'Load more';
+    loadMoreButton.addEventListener('click', function(e) {
+        e.preventDefault();
+        loadMoreButton.disabled = true;
+        loadAndDisplayGroups(nextCursor);
+    });
+    groupsList.appendChild(loadMoreButton);
+}
+
 // Helper function: Convert subject code to friendly name
 function getFriendlySubjectName(subjectCode) {
     return formatSubjectName(subjectCode);
@@ -277,8 +318,10 @@ function formatDate(dateString) {
 
 // Function to add click events to "Join" buttons
 function addJoinButtonEvents() {
-    const joinButtons = document.querySelectorAll('.join-btn:not(.disabled)');
+    // Skip buttons bound by an earlier page so a click joins only once
+    const joinButtons = document.querySelectorAll('.join-btn:not(.disabled):not([data-bound])');
     joinButtons.forEach(button => {
+        button.dataset.bound = 'true';
         button.addEventListener('click', function() {
             const groupId = this.getAttribute('data-groupid');
             joinGroup(groupId);
@@ -309,6 +352,10 @@ function joinGroupBackend(userId, groupId) {
                 window.location.href = '/login';
                 return { error: 'Not authenticated' };
             }
+            if (response.status === 404) {
+                // The group was deleted; the body says so
+                return response.json();
+            }
             throw new Error('Network response was not ok');
         }
         
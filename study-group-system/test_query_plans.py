@@ -0,0 +1,28 @@
+"""
+Query-plan regression test: every hot query must be planned without a SCAN
+step outside benchmarks.SCAN_ALLOWED. Run with
+
+    python -m pytest -q
+or
+    python -m unittest test_query_plans
+"""
+
+import unittest
+
+from benchmarks import SCAN_ALLOWED, check_query_plans
+
+
+class QueryPlanTest(unittest.TestCase):
+    def test_hot_queries_have_no_unexpected_scans(self):
+        results = check_query_plans()
+        failures = {name: scans for name, plan, scans in results if scans}
+        self.assertEqual(failures, {}, 'SCAN steps not in SCAN_ALLOWED')
+
+    def test_allow_list_has_no_stale_entries(self):
+        # An entry whose query no longer plans that step would silently allow it later
+        planned = {(name, step) for name, plan, scans in check_query_plans() for step in plan}
+        self.assertEqual(set(SCAN_ALLOWED) - planned, set())
+
+
+if __name__ == '__main__':
+    unittest.main()